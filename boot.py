@@ -6,6 +6,7 @@
 import time
 import machine
 import sys
+import gc
 
 print("=" * 50)
 print("ESP32-CAM Booting...")
@@ -19,7 +20,17 @@ print("Starting main application...")
 # Attempt to import and run main.py
 try:
     # This line loads your main application code from internal flash
+    # (main.py, or main.mpy from tools/build.py if there is no main.py)
+    gc.collect()
+    heap_before = gc.mem_free()
+    import_start = time.ticks_ms()
     import main 
+    import_ms = time.ticks_diff(time.ticks_ms(), import_start)
+    heap_used = heap_before - gc.mem_free()
+    gc.collect()
+    heap_kept = heap_before - gc.mem_free()
+    loaded = getattr(main, '__file__', 'main')
+    print(f"Imported {loaded} in {import_ms} ms, heap used {heap_used} bytes ({heap_kept} kept)")
     
     # Check if main has a main() function and run it
     if hasattr(main, 'main'):
@@ -32,11 +43,18 @@ except Exception as e:
     print(f"\nCRITICAL BOOT ERROR: {e}")
     import sys
     sys.print_exception(e)
+    # main.py shows this on its Diagnostics section after the reset
+    try:
+        with open("/reset_reason.txt", "w") as f:
+            f.write(f"boot.py: {e}")
+    except:
+        pass
 
 print("=" * 50)
 print("If you see this, the application exited.")
-print("Will soft reboot in 10 seconds to retry...")
+print("Will soft reboot in 3 seconds to retry...")
 print("=" * 50)
 
-time.sleep(10)
+# Short enough that the watchdog started by main.py doesn't fire first
+time.sleep(3)
 machine.reset()
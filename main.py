@@ -7,6 +7,13 @@ import machine
 import gc
 import utime
 import uos
+import json
+import select
+import errno
+
+# "Not ready yet" from a non-blocking socket. Compared by name: the ESP32
+# port numbers them differently from Linux (EINPROGRESS is 119 there, 115 is ENETDOWN)
+WOULD_BLOCK = (errno.EAGAIN, errno.EINPROGRESS, errno.ETIMEDOUT)
 
 # Configuration
 SSID = "YOUR_WIFI"
@@ -30,12 +37,218 @@ LOG_FOLDER_NAME = "logs"
 # Full Paths (Must be used for all file operations)
 PHOTO_FOLDER = SD_MOUNT_POINT + "/" + PHOTO_FOLDER_NAME
 LOG_FOLDER = SD_MOUNT_POINT + "/" + LOG_FOLDER_NAME
+
+# Photos are written as photo_....jpg.tmp and renamed when complete
+TEMP_SUFFIX = ".tmp"
+
+# Dashboard app.css / app.js on internal flash, uploaded from the
+# tools/build.py bundle (only used when DASHBOARD_CSS/JS below are None)
+ASSET_FOLDER = "/www"
 # ===============================================
 
+# --- CAPTURE SCHEDULE ---
+# Sits between the triggers (switch, MQTT, web button) and the camera.
+CAPTURE_EVERY_NTH = 1        # 1 = every layer, 2 = every other layer, ...
+CAPTURE_MIN_INTERVAL_S = 0   # ignore switch/MQTT triggers sooner than this after a photo
+CAPTURE_FALLBACK_S = 0       # no trigger for this long -> take one anyway (0 = off)
+# Background jobs (uploads, deleting old photos) stay out of the way when the
+# next trigger is expected within QUIET_GUARD_MS, judging by recent layer times
+QUIET_GUARD_MS = 1500
+# ---------------------------------------------
+
+# --- RUNTIME CONFIG FILE ---
+# Any of the settings named in CONFIG_KEYS can be overridden without
+# re-uploading main.py: put them in config.json on the SD card, e.g.
+#   {"CAPTURE_EVERY_NTH": 2, "BURST_FRAMES": 3, "UPLOAD_URL": "http://192.168.1.50:8080/upload"}
+# WiFi, pins and the watchdog are needed before the card is read, so they stay here.
+CONFIG_FILE = SD_MOUNT_POINT + "/config.json"
+CONFIG_KEYS = (
+    "CAMERA_RESOLUTION", "JPEG_QUALITY",
+    "CAPTURE_EVERY_NTH", "CAPTURE_MIN_INTERVAL_S", "CAPTURE_FALLBACK_S", "QUIET_GUARD_MS",
+    "BURST_FRAMES", "BURST_BUDGET_MS", "BURST_KEEP_ALL",
+    "UPLOAD_URL", "UPLOAD_CHUNK_SIZE", "UPLOAD_TIMEOUT_S", "UPLOAD_BACKOFF_MAX_S",
+    "PRINTER_IP", "PRINTER_SERIAL", "PRINTER_ACCESS_CODE", "MQTT_PORT", "MQTT_TLS",
+    "MQTT_KEEPALIVE_S", "TRIGGER_DEDUP_MS", "SHUTTER_DEBOUNCE_MS",
+    "RETAIN_MIN_FREE_MB", "RETAIN_MAX_FRAMES", "RETAIN_MAX_SESSIONS", "SESSION_GAP_S",
+    "RETENTION_BATCH", "SSE_MAX_CLIENTS", "FAILURES_BEFORE_RECOVERY", "MAX_SOFT_RECOVERIES",
+)
+# Allowed (lowest, highest) for the numbers; None = no upper limit.
+# A value outside is ignored, like one of the wrong type.
+CONFIG_RANGES = {
+    "CAMERA_RESOLUTION": (0, 13), "JPEG_QUALITY": (0, 63),
+    "CAPTURE_EVERY_NTH": (1, None), "CAPTURE_MIN_INTERVAL_S": (0, None),
+    "CAPTURE_FALLBACK_S": (0, None), "QUIET_GUARD_MS": (0, None),
+    "BURST_FRAMES": (1, 10), "BURST_BUDGET_MS": (0, None),
+    "UPLOAD_CHUNK_SIZE": (256, 16384), "UPLOAD_TIMEOUT_S": (1, None), "UPLOAD_BACKOFF_MAX_S": (1, None),
+    "MQTT_PORT": (1, 65535), "MQTT_KEEPALIVE_S": (5, 65535),
+    "TRIGGER_DEDUP_MS": (0, None), "SHUTTER_DEBOUNCE_MS": (0, None),
+    "RETAIN_MIN_FREE_MB": (0, None), "RETAIN_MAX_FRAMES": (0, None), "RETAIN_MAX_SESSIONS": (0, None),
+    "SESSION_GAP_S": (1, None), "RETENTION_BATCH": (1, None), "SSE_MAX_CLIENTS": (1, 5),
+    "FAILURES_BEFORE_RECOVERY": (1, None), "MAX_SOFT_RECOVERIES": (0, None),
+}
+# ---------------------------------------------
+
+# --- BURST MODE ---
+# Grab up to BURST_FRAMES frames per trigger and save only the sharpest one
+# (the biggest JPEG: fine detail compresses worst, blur and dark frames are
+# small). 1 = off. A burst stops after BURST_BUDGET_MS, or sooner if triggers
+# have been coming faster than that, so it never makes the next photo late.
+BURST_FRAMES = 1
+BURST_BUDGET_MS = 800
+BURST_KEEP_ALL = False       # also save the other frames, to pick from on the PC
+BURST_FOLDER = SD_MOUNT_POINT + "/burst"
+BURST_PENDING_MAX = 6        # kept frames waiting in RAM for a quiet moment to be written
+# ---------------------------------------------
+
+# --- OPTIONAL: PUSH EVERY PHOTO TO A PC ON YOUR LAN ---
+# Leave empty to disable. Run tools/receiver.py on the PC and put its address here:
+# UPLOAD_URL = "http://192.168.1.50:8080/upload"
+UPLOAD_URL = ""
+UPLOAD_CHUNK_SIZE = 2048     # bytes read from SD and sent per main loop pass
+UPLOAD_TIMEOUT_S = 5         # give up on a connect, a stalled send or the reply after this long
+UPLOAD_BACKOFF_MAX_S = 60    # longest wait between retries when the PC is offline
+# Photos that failed to upload are remembered here and retried later
+UPLOAD_QUEUE_FILE = LOG_FOLDER + "/upload_queue.txt"
+# ---------------------------------------------
+
+# --- OPTIONAL: TRIGGER ON THE PRINTER'S LAYER CHANGE (MQTT) ---
+# The printer reports layer_num over MQTT on your LAN. Fill these in to take a
+# photo on every layer change; leave PRINTER_IP empty to use only the switch.
+# Both can be on at the same time - a switch press and a layer change that
+# arrive within TRIGGER_DEDUP_MS count as one trigger.
+PRINTER_IP = ""
+PRINTER_SERIAL = ""          # Settings > Device on the printer screen
+PRINTER_ACCESS_CODE = ""     # LAN access code (Settings > Network)
+MQTT_PORT = 8883
+MQTT_TLS = True              # False + MQTT_PORT = 1883 for a plain local broker
+MQTT_KEEPALIVE_S = 60
+MQTT_CONNECT_TIMEOUT_S = 10  # connect + TLS + CONNACK must be done by then
+MQTT_MAX_PACKET = 16384      # bigger reports are skipped, not buffered
+TRIGGER_DEDUP_MS = 2000
+SHUTTER_DEBOUNCE_MS = 500
+# ---------------------------------------------
+
+# --- SD CARD SPACE / RETENTION ---
+# Oldest photos are deleted in small background batches before the card
+# fills, so captures keep working for the rest of a print. 0 = limit off;
+# all off (the default) never deletes anything.
+RETAIN_MIN_FREE_MB = 0       # always keep this much of the card free (at most a tenth of it), e.g. 50
+RETAIN_MAX_FRAMES = 0        # keep only the newest N photos
+RETAIN_MAX_SESSIONS = 0      # keep only the newest N prints
+SESSION_GAP_S = 30 * 60      # no photo for this long = a new print (same as tools/photolog.py)
+RETENTION_HEADROOM_FRAMES = 20  # start deleting this many frames before the floor
+RETENTION_BATCH = 5          # photos deleted per main loop pass
+FREE_SPACE_REFRESH_S = 300   # re-read the real free space (statvfs) this often
+# ---------------------------------------------
+
+# --- LIVE DASHBOARD UPDATES (Server-Sent Events on /events) ---
+SSE_MAX_CLIENTS = 3          # open dashboards getting live updates
+SSE_MAX_BUFFER = 2048        # bytes waiting per dashboard before it is dropped
+SSE_HEARTBEAT_S = 15
+# ---------------------------------------------
+
+# --- WEB SERVER LIMITS ---
+WEB_PORT = 80
+WEB_MAX_CONNECTIONS = 4       # requests handled at once; more get "503 busy"
+WEB_HEADER_TIMEOUT_MS = 3000  # a client has this long to send its request
+WEB_SEND_TIMEOUT_MS = 10000   # and this long to read the reply
+WEB_MAX_REQUEST = 2048        # bytes of request headers we accept
+# ---------------------------------------------
+
+# --- WATCHDOG / RECOVERY ---
+# The hardware watchdog resets the board if the main loop stops for
+# WDT_TIMEOUT_MS (0 = off). Before that, a failing camera, SD card, WiFi or
+# web socket is restarted on its own; only if that keeps failing
+# (MAX_SOFT_RECOVERIES within RECOVERY_WINDOW_S) is the whole board reset.
+# NOTE: once started the watchdog can't be stopped, so to get to >>> press
+# CTRL+C during the 2 second pause in boot.py, before main() starts it.
+WDT_TIMEOUT_MS = 30000
+WIFI_CONNECT_TIMEOUT_S = 30    # at boot; after that WiFi is retried in the background
+WIFI_CHECK_INTERVAL_S = 10
+FAILURES_BEFORE_RECOVERY = 2   # failed captures/writes/accepts in a row
+MAX_SOFT_RECOVERIES = 5
+RECOVERY_WINDOW_S = 600
+# On internal flash, so it is still readable when the SD card is the problem
+RESET_REASON_FILE = "/reset_reason.txt"
+RECOVERY_LOG = LOG_FOLDER + "/recovery.log"
+# ---------------------------------------------
+
 # Initialize
 shutter = machine.Pin(SHUTTER_PIN, machine.Pin.IN, machine.Pin.PULL_UP)
 picture_count = 0
 last_shutter_state = None
+last_shutter_press = None
+
+# Trigger queue shared by the switch, MQTT and the web button
+trigger_queue = []          # (source, ticks_ms when the trigger arrived)
+last_trigger_ms = None     # last switch/MQTT (layer) trigger
+last_interval_ms = None     # last photo from the CAPTURE_FALLBACK_S timer
+last_trigger_source = None
+last_trigger_latency_ms = None
+trigger_gaps_ms = []        # time between the last few layer triggers
+trigger_count = 0           # switch/MQTT triggers seen, for CAPTURE_EVERY_NTH
+last_capture_ms = None
+last_burst_ms = None
+burst_pending = []          # (photo number, k, frame) not picked by a burst, still to save
+
+# MQTT state (see MQTT LAYER TRIGGER below)
+mqtt_sock = None
+mqtt_state = None           # "connecting" (TCP), "connack" (waiting for the broker), "up"
+mqtt_poller = None
+mqtt_out = b""              # bytes the non-blocking socket hasn't taken yet
+mqtt_deadline = 0
+mqtt_addr = None
+mqtt_buf = b""
+mqtt_skip = 0
+mqtt_layer = None
+mqtt_retry_at = 0
+mqtt_backoff = 0
+mqtt_last_rx = 0
+mqtt_last_ping = 0
+
+# Free space / retention state (see SD SPACE AND RETENTION below)
+free_bytes = None           # estimate, updated from frame sizes between statvfs calls
+cluster_bytes = 32768
+card_bytes = 0              # card size from statvfs, 0 until known
+free_refreshed_at = 0
+avg_frame_bytes = 0
+photo_total = 0
+photo_bytes = None          # total photo size for the page; None until first counted
+last_frame_time = None
+retention_due = False       # checked after the first capture, never straight after boot
+retention_queue = []        # oldest photos picked for deletion
+
+# Web server state (see WEB SERVER below)
+web_poller = None
+web_conns = []              # open requests: dicts with sock, state, buffers, deadline
+
+# Open /events connections: [socket, bytes not sent yet]
+sse_clients = []
+sse_last_heartbeat = 0
+
+# Watchdog / recovery state (see WATCHDOG AND RECOVERY below)
+wdt = None
+boot_ticks = utime.ticks_ms()
+boot_ready_ms = None        # reset -> ready to capture
+reset_cause = "unknown"
+previous_reset_reason = None
+health_failures = {}        # subsystem -> failures in a row
+health_failed_at = {}       # subsystem -> ticks_ms of the first of those failures
+recovery_history = {}       # subsystem -> ticks_ms of recent soft recoveries
+recovery_events = []        # last few recoveries, for the status page
+wifi_reconnect_started = None
+wifi_last_check = 0
+
+# Uploader state (see BACKGROUND UPLOADER below)
+upload_pending = []        # filenames waiting to be sent, oldest first
+upload_job = None          # the photo currently being sent
+upload_sock = None         # kept open between photos (HTTP keep-alive)
+upload_addr = None         # UPLOAD_URL host resolved once: a DNS lookup blocks
+upload_queue_saved = False # True while UPLOAD_QUEUE_FILE holds the pending list
+upload_retry_at = 0
+upload_backoff = 0
+upload_sent = 0
+upload_failed_count = 0
 
 def get_formatted_time():
     """Get formatted time string for MicroPython"""
@@ -95,8 +308,15 @@ def setup_filesystem():
         else:
             print(f"  Logs folder exists: {LOG_FOLDER}")
         
+        # Clean up photos that were being written when power was lost
+        recover_temp_files(PHOTO_FOLDER)
+        if "burst" in sd_root_contents:
+            recover_temp_files(BURST_FOLDER)  # kept burst frames are written the same way
+        
         # Count existing photos
-        global picture_count
+        global picture_count, photo_total, photo_bytes
+        photo_total = 0
+        photo_bytes = None
         try:
             # List contents of the photo folder on the SD card
             photo_files = [f for f in uos.listdir(PHOTO_FOLDER) if f.endswith('.jpg')]
@@ -106,17 +326,13 @@ def setup_filesystem():
                 # Find the highest number (logic updated to find the 4-digit number)
                 max_num = -1
                 for f in photo_files:
-                    try:
-                        if f.startswith('photo_') and f.endswith('.jpg'):
-                            # Extract the number from 'photo_NNNN_...'
-                            num_str = f[6:10]
-                            num = int(num_str)
-                            if num > max_num:
-                                max_num = num
-                    except:
-                        pass
+                    # Extract the number from 'photo_NNNN_...'
+                    num = photo_number(f)
+                    if num is not None and num > max_num:
+                        max_num = num
                 
                 picture_count = max_num + 1 if max_num >= 0 else 0
+                photo_total = len(photo_files)
                 print(f"  Found {len(photo_files)} existing photos")
                 print(f"  Next photo number: {picture_count}")
             else:
@@ -132,6 +348,56 @@ def setup_filesystem():
         print(f" Filesystem setup failed: {e}")
         return False
 
+def is_complete_jpeg(path):
+    """A whole JPEG ends with the EOI marker FF D9"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(-2, 2)
+            return f.read(2) == b"\xff\xd9"
+    except:
+        return False
+
+def photo_number(name):
+    """NNNN from 'photo_NNNN_....jpg', or None if it is not one of our photos"""
+    if not (name.startswith("photo_") and name.endswith(".jpg")) or name[10:11] != "_":
+        return None
+    try:
+        return int(name[6:10])
+    except ValueError:
+        return None
+
+def recover_temp_files(folder):
+    """Finish or remove photos (or kept burst frames) left half-written by a power cut or reset"""
+    try:
+        names = uos.listdir(folder)
+    except Exception as e:
+        print(f"  Note: Could not check for unfinished photos: {e}")
+        return
+    
+    for name in names:
+        if not name.endswith(TEMP_SUFFIX):
+            continue
+        final_name = name[:-len(TEMP_SUFFIX)]
+        num = photo_number(final_name)
+        if num is None:
+            # Not written by take_photo; leave other people's files alone
+            print(f"  Skipping unknown temp file: {name}")
+            continue
+        tmp_path = folder + "/" + name
+        try:
+            if final_name not in names and is_complete_jpeg(tmp_path):
+                # Written and closed, only the rename was missed
+                size = os.stat(tmp_path)[6]
+                uos.rename(tmp_path, folder + "/" + final_name)
+                if folder == PHOTO_FOLDER:
+                    save_photo_log(final_name, size, num)
+                print(f"  Recovered unfinished photo: {final_name}")
+            else:
+                uos.remove(tmp_path)
+                print(f"  Removed incomplete photo: {name}")
+        except Exception as e:
+            print(f"  Could not clean up {name}: {e}")
+
 def connect_wifi():
     sta_if = network.WLAN(network.STA_IF)
     sta_if.active(True)
@@ -139,13 +405,21 @@ def connect_wifi():
     if not sta_if.isconnected():
         print('Connecting to WiFi as', DEVICE_NAME, '...')
         sta_if.connect(SSID, PASSWORD)
+        started = time.time()
         while not sta_if.isconnected():
+            feed_watchdog()
+            if time.time() - started > WIFI_CONNECT_TIMEOUT_S:
+                # The switch still works without WiFi; keep retrying in the background
+                print()
+                print('WiFi not connected yet, continuing without it')
+                return False
             time.sleep(0.5)
             print('.', end='')
         print()
     print('WiFi connected!')
     print('Device Name:', DEVICE_NAME)
     print('IP Address:', sta_if.ifconfig()[0])
+    return True
 
 def init_camera():
     """
@@ -180,7 +454,18 @@ def take_photo():
         print("\n" + "=" * 40)
         print(" Capturing photo...")
         
-        buf = camera.capture()
+        try:
+            frames = capture_frames()
+        except Exception as e:
+            print(f" Camera capture failed: {e}")
+            send_event("capture_failed", {"reason": f"camera: {e}"})
+            report_health("camera", False)
+            return False
+        report_health("camera", True)
+        best = select_best_frame(frames)
+        buf = frames[best]
+        extras = [f for i, f in enumerate(frames) if i != best] if BURST_KEEP_ALL else []
+        frames = None
         print(f"  Captured: {len(buf)} bytes")
         
         current_time = utime.localtime()
@@ -194,42 +479,149 @@ def take_photo():
         print(f"  Saving as: {filename}")
         print(f"  Full path: {full_path}")
         
-        # Save the file
-        with open(full_path, "wb") as f:
-            f.write(buf)
+        if free_bytes is not None and free_bytes < len(buf) * 2:
+            if retention_enabled():
+                # Background deletion fell behind: make room now rather than fail
+                print("  Card almost full, deleting oldest photos first")
+                make_room_now()
+            else:
+                # All limits are off: the user's photos are never deleted for space
+                print("  Card almost full and retention is off, the photo may not fit")
+        
+        # Write under a temporary name and rename once complete, so a
+        # photo_NNNN_*.jpg on the card is always a whole frame
+        tmp_path = full_path + TEMP_SUFFIX
+        try:
+            with open(tmp_path, "wb") as f:
+                written = f.write(buf)
+        except OSError as e:
+            if e.args[0] != 28:
+                raise
+            # ENOSPC: the card is full, not broken, so no SD recovery
+            print(" Card full, photo not saved")
+            send_event("capture_failed", {"reason": "card full"})
+            try:
+                uos.remove(tmp_path)
+            except:
+                pass
+            return False
+        
+        if written != len(buf):
+            print(f" Short write: {written} != {len(buf)}")
+            send_event("capture_failed", {"reason": "short write to SD"})
+            report_health("sd", False)
+            try:
+                uos.remove(tmp_path)
+            except:
+                pass
+            return False
+        
+        uos.rename(tmp_path, full_path)
         
         # Force file to disk - This is critical for SD card reliability
         sync_filesystem()
         
         gc.collect()
         
-        try:
-            # os.stat now checks the file on the mounted SD card
-            file_size = os.stat(full_path)[6]
-            if file_size == len(buf):
-                print(f" Photo saved successfully!")
-                print(f"   File: {filename}")
-                print(f"   Size: {file_size} bytes")
-                print(f"   Path: {full_path}")
-                
-                save_photo_log(filename, len(buf), picture_count)
-                
-                picture_count += 1
-                return True
-            else:
-                print(f" File size mismatch: {file_size} != {len(buf)}")
-                return False
-                
-        except Exception as e:
-            print(f" Could not verify file: {e}")
-            return False
+        print(f" Photo saved successfully!")
+        print(f"   File: {filename}")
+        print(f"   Size: {written} bytes")
+        print(f"   Path: {full_path}")
+        
+        save_photo_log(filename, written, picture_count)
+        queue_upload(filename)
+        note_frame_saved(written)
+        if extras:
+            queue_burst_extras(picture_count, extras)
+        report_health("sd", True)
+        send_event("frame", {"num": picture_count, "name": filename, "size": written})
+        
+        picture_count += 1
+        return True
             
     except Exception as e:
         print(f" Photo capture failed: {e}")
+        send_event("capture_failed", {"reason": f"{e}"})
+        report_health("sd", False)
         return False
     finally:
         print("=" * 40)
 
+def burst_budget_ms():
+    """Time a burst may take: the budget, or half the shortest recent trigger gap"""
+    budget = BURST_BUDGET_MS
+    if trigger_gaps_ms:
+        budget = min(budget, min(trigger_gaps_ms) // 2)
+    return budget
+
+def capture_frames():
+    """Capture one frame, or a burst of up to BURST_FRAMES inside the time budget"""
+    global last_burst_ms
+    start = utime.ticks_ms()
+    buf = camera.capture()
+    if not buf:
+        raise OSError("empty frame")
+    frames = [buf]
+    if BURST_FRAMES <= 1:
+        return frames
+    
+    budget = burst_budget_ms()
+    while len(frames) < BURST_FRAMES:
+        elapsed = utime.ticks_diff(utime.ticks_ms(), start)
+        per_frame = elapsed // len(frames)
+        if elapsed + per_frame > budget:
+            break
+        check_shutter()
+        if trigger_queue:
+            break  # the next trigger is already waiting
+        try:
+            buf = camera.capture()
+        except MemoryError:
+            break
+        if buf:
+            frames.append(buf)
+    last_burst_ms = utime.ticks_diff(utime.ticks_ms(), start)
+    print(f"  Burst: {len(frames)} frames in {last_burst_ms} ms (budget {budget} ms)")
+    return frames
+
+def select_best_frame(frames):
+    """Index of the sharpest frame, using JPEG size as the sharpness proxy"""
+    best = 0
+    for i in range(1, len(frames)):
+        if len(frames[i]) > len(frames[best]):
+            best = i
+    if len(frames) > 1:
+        print(f"  Burst sizes: {[len(f) for f in frames]}, keeping #{best}")
+    return best
+
+def queue_burst_extras(photo_num, extras):
+    """Keep the frames the burst did not pick, for choosing on the PC.
+    They are written later by service_burst_extras, not in the capture path."""
+    for k, frame in enumerate(extras):
+        burst_pending.append((photo_num, k, frame))
+    while len(burst_pending) > BURST_PENDING_MAX:
+        num, k, frame = burst_pending.pop(0)
+        print(f"  No quiet moment to save burst frame {num:04d}_b{k}, dropped")
+
+def service_burst_extras():
+    """Write one waiting burst frame per main loop pass"""
+    if not burst_pending:
+        return
+    num, k, frame = burst_pending.pop(0)
+    if k == 0:
+        try:
+            uos.mkdir(BURST_FOLDER)
+        except OSError:
+            pass
+    path = f"{BURST_FOLDER}/photo_{num:04d}_b{k}.jpg"
+    try:
+        with open(path + TEMP_SUFFIX, "wb") as f:
+            written = f.write(frame)
+        uos.rename(path + TEMP_SUFFIX, path)
+        note_space_used(written)
+    except Exception as e:
+        print(f"  Could not save burst frame {k}: {e}")
+
 def save_photo_log(filename, size, photo_num):
     """Save a log entry for the photo"""
     try:
@@ -268,6 +660,13 @@ def get_photo_count():
     photos = list_photos()
     return len(photos)
 
+def photo_bytes_total():
+    """Total photo size, counted once and then kept up to date as photos come and go"""
+    global photo_bytes
+    if photo_bytes is None:
+        photo_bytes = get_total_file_size()
+    return photo_bytes
+
 def get_total_file_size():
     """Get total size of all photos"""
     total_size = 0
@@ -296,8 +695,10 @@ def format_sd_card():
         # Iterate over the contents of the SD card mount point (CRITICAL FIX)
         items = uos.listdir(SD_MOUNT_POINT)
         print(f"Found {len(items)} items on SD card to check")
+        send_event("format", {"deleted": 0, "done": False})
         
         for item in items:
+            feed_watchdog()
             try:
                 full_path = SD_MOUNT_POINT + '/' + item
                 
@@ -313,10 +714,14 @@ def format_sd_card():
                     # Delete files inside directory first
                     sub_items = uos.listdir(full_path)
                     for sub_item in sub_items:
+                        feed_watchdog()
                         try:
                             uos.remove(full_path + '/' + sub_item)
                             deleted_count += 1
                             print(f"    Deleted file: {sub_item}")
+                            if deleted_count % 20 == 0:
+                                # The loop can take a while; let dashboards see progress
+                                send_event("format", {"deleted": deleted_count, "done": False})
                         except Exception as e:
                             error_count += 1
                     
@@ -348,6 +753,10 @@ def format_sd_card():
         
         global picture_count
         picture_count = 0
+        upload_reset()
+        retention_reset()
+        
+        send_event("format", {"deleted": deleted_count, "errors": error_count, "done": True})
         
         print(f"\n Format complete!")
         print(f"   Deleted: {deleted_count} items")
@@ -359,114 +768,192 @@ def format_sd_card():
         
     except Exception as e:
         print(f" Format failed: {e}")
+        send_event("format", {"deleted": deleted_count, "done": True, "failed": True})
         return False, deleted_count, error_count
 
+# Dashboard styles and script, served as /app.css and /app.js so the browser
+# caches them. Bytes, so they go out without an encode() copy per request.
+# tools/build.py moves both into files under ASSET_FOLDER and sets them to None.
+DASHBOARD_CSS = b"""
+    body { font-family: Arial, sans-serif; margin: 20px; background: #f5f5f5; }
+    .container { max-width: 900px; margin: 0 auto; background: white; padding: 20px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
+    h1 { color: #333; border-bottom: 2px solid #4CAF50; padding-bottom: 10px; }
+    h2 { color: #444; margin-top: 25px; }
+    .stats { 
+        background: #e8f5e9; 
+        padding: 15px; 
+        border-radius: 5px; 
+        margin: 15px 0;
+        display: grid;
+        grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
+        gap: 10px;
+    }
+    .stat-item { text-align: center; }
+    .stat-value { font-size: 24px; font-weight: bold; color: #4CAF50; }
+    .stat-label { font-size: 14px; color: #666; }
+    .shutter-btn { 
+        background: #4CAF50; 
+        color: white; 
+        border: none; 
+        padding: 15px 30px; 
+        font-size: 20px; 
+        border-radius: 5px; 
+        cursor: pointer;
+        display: block;
+        margin: 20px auto;
+        width: 100%;
+        max-width: 300px;
+    }
+    .shutter-btn:hover { background: #45a049; }
+    .action-btn { 
+        background: #2196F3; 
+        color: white; 
+        border: none; 
+        padding: 10px 15px; 
+        border-radius: 4px; 
+        cursor: pointer;
+        margin: 5px;
+    }
+    .action-btn:hover { opacity: 0.8; }
+    .sync-btn { 
+        background: #FF9800; 
+        color: white; 
+        border: none; 
+        padding: 10px 15px; 
+        border-radius: 4px; 
+        cursor: pointer;
+        margin: 5px;
+    }
+    .photo-list { 
+        max-height: 400px; 
+        overflow-y: auto; 
+        border: 1px solid #ddd; 
+        padding: 15px; 
+        border-radius: 5px;
+        margin: 15px 0;
+    }
+    .photo-item { 
+        padding: 10px; 
+        border-bottom: 1px solid #eee; 
+        display: flex; 
+        justify-content: space-between;
+        align-items: center;
+    }
+    .photo-item:last-child { border-bottom: none; }
+    .photo-name { font-family: monospace; }
+    .photo-size { color: #666; font-size: 14px; }
+    .warning { 
+        background: #fff3cd; 
+        border: 1px solid #ffc107;
+        color: #856404;
+        padding: 15px;
+        border-radius: 5px;
+        margin: 15px 0;
+    }
+    .critical-warning { 
+        background: #f8d7da; 
+        border: 2px solid #dc3545;
+        color: #721c24;
+        padding: 15px;
+        border-radius: 5px;
+        margin: 20px 0;
+        font-weight: bold;
+    }
+    .folder-path { 
+        background: #e3f2fd; 
+        padding: 10px; 
+        border-radius: 5px; 
+        margin: 10px 0;
+        font-family: monospace;
+    }
+    .live-status { text-align: center; color: #666; min-height: 20px; }
+"""
+
+# Live updates from /events, so the page never needs reloading
+DASHBOARD_JS = b"""
+function setStatus(text) { document.getElementById('live-status').textContent = text; }
+function takePhoto() {
+    if (!window.EventSource) { location.href = '/takePhoto'; return; }
+    setStatus('Taking photo...');
+    fetch('/takePhoto').catch(function() { location.href = '/takePhoto'; });
+}
+function pad4(n) { return ('000' + n).slice(-4); }
+window.addEventListener('load', function() {
+    if (!window.EventSource) return;
+    var es = new EventSource('/events');
+    es.addEventListener('frame', function(e) {
+        var d = JSON.parse(e.data);
+        var count = document.getElementById('photo-count');
+        var total = parseInt(count.textContent) + 1;
+        count.textContent = total;
+        document.getElementById('recent-total').textContent = total;
+        var kb = document.getElementById('total-kb');
+        kb.textContent = parseInt(kb.textContent) + Math.floor(d.size / 1024);
+        document.getElementById('next-num').textContent = pad4(d.num + 1);
+        var left = document.getElementById('frames-left');
+        if (parseInt(left.textContent) > 0) left.textContent = parseInt(left.textContent) - 1;
+        var list = document.getElementById('photo-list');
+        if (!list.querySelector('.photo-item')) list.innerHTML = '';
+        var item = document.createElement('div');
+        item.className = 'photo-item';
+        item.innerHTML = '<div class="photo-name"></div><div class="photo-size"></div>';
+        item.firstChild.textContent = d.name;
+        item.lastChild.textContent = Math.floor(d.size / 1024) + ' KB';
+        list.insertBefore(item, list.firstChild);
+        while (list.children.length > 10) list.removeChild(list.lastChild);
+        setStatus('Saved ' + d.name);
+    });
+    es.addEventListener('evicted', function(e) {
+        var d = JSON.parse(e.data);
+        var count = document.getElementById('photo-count');
+        count.textContent = Math.max(0, parseInt(count.textContent) - d.count);
+        document.getElementById('recent-total').textContent = count.textContent;
+        var kb = document.getElementById('total-kb');
+        kb.textContent = Math.max(0, parseInt(kb.textContent) - Math.floor(d.bytes / 1024));
+    });
+    es.addEventListener('capture_failed', function(e) {
+        setStatus('Capture failed: ' + JSON.parse(e.data).reason);
+    });
+    es.addEventListener('sync', function(e) {
+        setStatus(JSON.parse(e.data).ok ? 'Filesystem synced' : 'Sync failed');
+    });
+    es.addEventListener('format', function(e) {
+        var d = JSON.parse(e.data);
+        if (!d.done) { setStatus('Formatting... ' + d.deleted + ' deleted'); return; }
+        setStatus(d.failed ? 'Format failed' : 'Format complete, ' + d.deleted + ' deleted');
+        if (!d.failed) setTimeout(function() { location.reload(); }, 1000);
+    });
+});
+"""
+
 def web_page():
     photos = list_photos()
     photo_count = len(photos)
-    total_size_kb = get_total_file_size() // 1024
+    total_size_kb = photo_bytes_total() // 1024
     current_time = get_formatted_time()
     
     recent_photos = photos[-10:] if len(photos) > 10 else photos
     recent_photos.reverse()
     
+    remaining = frames_remaining()
+    frames_left = "?" if remaining is None else remaining
+    free_mb = "?" if free_bytes is None else free_bytes // (1024 * 1024)
+    
+    reset_reason = previous_reset_reason or "none recorded"
+    recoveries = "<br>".join(recovery_events) or "none"
+    
+    status_extra = ""
+    if last_trigger_latency_ms is not None:
+        status_extra += f" | Last trigger ({last_trigger_source}) to saved: {last_trigger_latency_ms} ms"
+    if UPLOAD_URL:
+        status_extra += f" | Uploaded: {upload_sent} | Upload queue: {len(upload_pending)}"
+    
     # ... (HTML content remains the same)
     html = f"""<html>
     <head><title>{DEVICE_NAME} - Photo Station</title>
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        body {{ font-family: Arial, sans-serif; margin: 20px; background: #f5f5f5; }}
-        .container {{ max-width: 900px; margin: 0 auto; background: white; padding: 20px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-        h1 {{ color: #333; border-bottom: 2px solid #4CAF50; padding-bottom: 10px; }}
-        h2 {{ color: #444; margin-top: 25px; }}
-        .stats {{ 
-            background: #e8f5e9; 
-            padding: 15px; 
-            border-radius: 5px; 
-            margin: 15px 0;
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 10px;
-        }}
-        .stat-item {{ text-align: center; }}
-        .stat-value {{ font-size: 24px; font-weight: bold; color: #4CAF50; }}
-        .stat-label {{ font-size: 14px; color: #666; }}
-        .shutter-btn {{ 
-            background: #4CAF50; 
-            color: white; 
-            border: none; 
-            padding: 15px 30px; 
-            font-size: 20px; 
-            border-radius: 5px; 
-            cursor: pointer;
-            display: block;
-            margin: 20px auto;
-            width: 100%;
-            max-width: 300px;
-        }}
-        .shutter-btn:hover {{ background: #45a049; }}
-        .action-btn {{ 
-            background: #2196F3; 
-            color: white; 
-            border: none; 
-            padding: 10px 15px; 
-            border-radius: 4px; 
-            cursor: pointer;
-            margin: 5px;
-        }}
-        .action-btn:hover {{ opacity: 0.8; }}
-        .sync-btn {{ 
-            background: #FF9800; 
-            color: white; 
-            border: none; 
-            padding: 10px 15px; 
-            border-radius: 4px; 
-            cursor: pointer;
-            margin: 5px;
-        }}
-        .photo-list {{ 
-            max-height: 400px; 
-            overflow-y: auto; 
-            border: 1px solid #ddd; 
-            padding: 15px; 
-            border-radius: 5px;
-            margin: 15px 0;
-        }}
-        .photo-item {{ 
-            padding: 10px; 
-            border-bottom: 1px solid #eee; 
-            display: flex; 
-            justify-content: space-between;
-            align-items: center;
-        }}
-        .photo-item:last-child {{ border-bottom: none; }}
-        .photo-name {{ font-family: monospace; }}
-        .photo-size {{ color: #666; font-size: 14px; }}
-        .warning {{ 
-            background: #fff3cd; 
-            border: 1px solid #ffc107;
-            color: #856404;
-            padding: 15px;
-            border-radius: 5px;
-            margin: 15px 0;
-        }}
-        .critical-warning {{ 
-            background: #f8d7da; 
-            border: 2px solid #dc3545;
-            color: #721c24;
-            padding: 15px;
-            border-radius: 5px;
-            margin: 20px 0;
-            font-weight: bold;
-        }}
-        .folder-path {{ 
-            background: #e3f2fd; 
-            padding: 10px; 
-            border-radius: 5px; 
-            margin: 10px 0;
-            font-family: monospace;
-        }}
-    </style>
+    <link rel="stylesheet" href="/app.css">
+    <script src="/app.js"></script>
     </head>
     <body>
         <div class="container">
@@ -479,26 +966,31 @@ def web_page():
             
             <div class="stats">
                 <div class="stat-item">
-                    <div class="stat-value">{photo_count}</div>
+                    <div class="stat-value" id="photo-count">{photo_count}</div>
                     <div class="stat-label">Photos Taken</div>
                 </div>
                 <div class="stat-item">
-                    <div class="stat-value">{total_size_kb} KB</div>
+                    <div class="stat-value"><span id="total-kb">{total_size_kb}</span> KB</div>
                     <div class="stat-label">Total Size</div>
                 </div>
                 <div class="stat-item">
-                    <div class="stat-value">{picture_count:04d}</div>
+                    <div class="stat-value" id="next-num">{picture_count:04d}</div>
                     <div class="stat-label">Next Photo #</div>
                 </div>
+                <div class="stat-item">
+                    <div class="stat-value" id="frames-left">{frames_left}</div>
+                    <div class="stat-label">Photos Left ({free_mb} MB free)</div>
+                </div>
             </div>
             
             <div class="folder-path">
                 <strong>Photos are saved to:</strong> {PHOTO_FOLDER}/
             </div>
             
-            <button class="shutter-btn" onclick="location.href='/takePhoto'">
+            <button class="shutter-btn" onclick="takePhoto()">
                 TAKE PHOTO NOW
             </button>
+            <div id="live-status" class="live-status"></div>
             
             <div style="text-align: center; margin: 20px 0;">
                 <button class="action-btn" onclick="location.href='/'">Refresh</button>
@@ -507,8 +999,8 @@ def web_page():
                 <button class="action-btn" onclick="if(confirm('Reboot camera?')) location.href='/reboot'">Reboot</button>
             </div>
             
-            <h2>Recent Photos ({photo_count} total)</h2>
-            <div class="photo-list">
+            <h2>Recent Photos (<span id="recent-total">{photo_count}</span> total)</h2>
+            <div class="photo-list" id="photo-list">
     """
   
     if recent_photos:
@@ -532,6 +1024,14 @@ def web_page():
     html += f"""
             </div>
             
+            <h2>Diagnostics</h2>
+            <div class="folder-path">
+                Reset cause: {reset_cause}<br>
+                Previous reset reason: {reset_reason}<br>
+                Boot to ready: {boot_ready_ms} ms<br>
+                Recent recoveries: {recoveries}
+            </div>
+            
             <div class="warning">
                 <strong>SD Card Safety:</strong>
                 <ul style="margin: 10px 0; padding-left: 20px;">
@@ -543,7 +1043,7 @@ def web_page():
             </div>
             
             <div style="margin-top: 30px; color: #666; font-size: 12px; text-align: center;">
-                {DEVICE_NAME} | {current_time} | Total photos: {photo_count}
+                {DEVICE_NAME} | {current_time} | Total photos: {photo_count}{status_extra}
             </div>
         </div>
     </body>
@@ -622,204 +1122,1383 @@ def sync_filesystem():
             print("Filesystem sync failed.")
             return False
 
-def handle_web_requests():
-    """Handle web requests"""
-    global picture_count
-    
+# === BACKGROUND UPLOADER ===
+# Each saved photo is POSTed to UPLOAD_URL straight from the SD card, one
+# UPLOAD_CHUNK_SIZE slice per main loop pass, so the shutter is never kept
+# waiting for the network. The socket is non-blocking from the connect on:
+# an offline or stalled PC only means nothing moves for a while. Failed
+# photos go to UPLOAD_QUEUE_FILE and are retried with backoff until the PC
+# comes back.
+def parse_upload_url(url):
+    """Split http://host:port/path into (host, port, path)"""
+    if not url.startswith("http://"):
+        raise ValueError("UPLOAD_URL must start with http://")
+    rest = url[7:]
+    slash = rest.find("/")
+    if slash < 0:
+        host_port, path = rest, "/"
+    else:
+        host_port, path = rest[:slash], rest[slash:]
+    if ":" in host_port:
+        host, port = host_port.split(":", 1)
+        return host, int(port), path
+    return host_port, 80, path
+
+def queue_upload(filename):
+    """Add a saved photo to the upload queue"""
+    if not UPLOAD_URL:
+        return
+    upload_pending.append(filename)
+    if upload_queue_saved:
+        # Receiver is offline: make sure this one survives a power cut too
+        try:
+            with open(UPLOAD_QUEUE_FILE, "a") as f:
+                f.write(filename + "\n")
+        except Exception as e:
+            print(f"Could not update upload queue: {e}")
+
+def load_upload_queue():
+    """Reload photos that were still waiting to upload before the last reboot"""
+    global upload_queue_saved
+    if not UPLOAD_URL:
+        return
     try:
-        conn, addr = s.accept()
-        print(f'Client connected from {addr[0]}')
-        
-        # Set timeout for receiving request
-        conn.settimeout(5.0)
-        request = conn.recv(1024)
-        
-        if request:
-            request_str = request.decode()
-            
-            if 'GET / ' in request_str:
-                conn.send('HTTP/1.1 200 OK\r\n')
-                conn.send('Content-Type: text/html\r\n')
-                conn.send('Connection: close\r\n\r\n')
-                conn.sendall(web_page())
-                conn.close()
-                        
-            elif 'GET /takePhoto' in request_str:
-                # Send immediate response - don't wait for photo to complete
-                conn.send('HTTP/1.1 200 OK\r\n')
-                conn.send('Content-Type: text/html\r\n')
-                conn.send('Connection: close\r\n\r\n')
-                
-                # HTML with auto-refresh and message
-                html = '''
-                <html>
-                <head>
-                    <meta http-equiv="refresh" content="3;url=/">
-                    <style>
-                        body { font-family: Arial; margin: 40px; text-align: center; }
-                        .spinner {
-                            border: 8px solid #f3f3f3;
-                            border-top: 8px solid #3498db;
-                            border-radius: 50%;
-                            width: 60px;
-                            height: 60px;
-                            animation: spin 2s linear infinite;
-                            margin: 20px auto;
-                        }
-                        @keyframes spin {
-                            0% { transform: rotate(0deg); }
-                            100% { transform: rotate(360deg); }
-                        }
-                    </style>
-                </head>
-                <body>
-                    <h1>Taking Photo...</h1>
-                    <div class="spinner"></div>
-                    <p>Please wait while the photo is being taken.</p>
-                    <p>You will be redirected back to the main page in a few seconds.</p>
-                </body>
-                </html>
-                '''
-                conn.sendall(html)
-                conn.close()
-                
-                # Now take the photo in the background (non-blocking)
-                print("Starting photo capture in background...")
-                take_photo()
-            
-            elif 'GET /format' in request_str:
-                success, deleted, errors = format_sd_card()
-                
-                if success:
-                    message = f"SD Card Formatted!<br>"
-                    message += f"Deleted {deleted} items"
-                    if errors > 0:
-                        message += f"<br>({errors} items could not be deleted)"
-                    
-                    html = f"""
-                    <html><body style="font-family: Arial; margin: 40px; text-align: center;">
-                    <h1>{message}</h1>
-                    <p>Ready for new photos.</p>
-                    <button onclick="location.href='/'" style="padding: 10px 20px; background: #4CAF50; color: white; border: none; border-radius: 4px; cursor: pointer;">
-                        Back to Main Page
-                    </button>
-                    <script>setTimeout(function(){{ location.href="/"; }}, 5000);</script>
-                    </body></html>
-                    """
-                else:
-                    html = f"""
-                    <html><body style="font-family: Arial; margin: 40px; text-align: center;">
-                    <h1>Format Failed</h1>
-                    <p>Could not format SD card.</p>
-                    <p>Try physically removing and reinserting the SD card.</p>
-                    <button onclick="location.href='/'" style="padding: 10px 20px; background: #2196F3; color: white; border: none; border-radius: 4px; cursor: pointer;">
-                        Back
-                    </button>
-                    </body></html>
-                    """
-                
-                conn.send('HTTP/1.1 200 OK\r\n')
-                conn.send('Content-Type: text/html\r\n')
-                conn.send('Connection: close\r\n\r\n')
-                conn.sendall(html)
-                conn.close()
-
-            elif 'GET /sync' in request_str:
-                # Sync filesystem before power off
-                success = sync_filesystem()
-                
-                if success:
-                    html = """
-                    <html><body style="font-family: Arial; margin: 40px; text-align: center;">
-                    <h1>Filesystem Synced!</h1>
-                    <p>It is now safe to power off the ESP32.</p>
-                    <p><strong>Wait 10 seconds</strong> after seeing this message before removing power.</p>
-                    <button onclick="location.href='/'" style="padding: 10px 20px; background: #4CAF50; color: white; border: none; border-radius: 4px; cursor: pointer;">
-                        Back to Main Page
-                    </button>
-                    <script>setTimeout(function(){ location.href="/"; }, 10000);</script>
-                    </body></html>
-                    """
-                else:
-                    html = """
-                    <html><body style="font-family: Arial; margin: 40px; text-align: center;">
-                    <h1>Sync Failed</h1>
-                    <p>Could not sync filesystem. Wait 30 seconds before powering off.</p>
-                    <button onclick="location.href='/'" style="padding: 10px 20px; background: #2196F3; color: white; border: none; border-radius: 4px; cursor: pointer;">
-                        Back
-                    </button>
-                    </body></html>
-                    """
-                
-                conn.send('HTTP/1.1 200 OK\r\n')
-                conn.send('Content-Type: text/html\r\n')
-                conn.send('Connection: close\r\n\r\n')
-                conn.sendall(html)
-                conn.close()
-            
-            elif 'GET /reboot' in request_str:
-                conn.send('HTTP/1.1 200 OK\r\n')
-                conn.send('Content-Type: text/html\r\n')
-                conn.send('Connection: close\r\n\r\n')
-                html = '''
-                <html>
-                <body style="font-family: Arial; margin: 40px; text-align: center;">
-                <h1>Rebooting Camera...</h1>
-                <p>The camera is now restarting.</p>
-                <p>Please wait 10-15 seconds and refresh the page.</p>
-                <p><a href="/">Click here if not redirected in 15 seconds</a></p>
-                <script>
-                    setTimeout(function() {
-                        location.href = "/";
-                    }, 15000);
-                </script>
-                </body>
-                </html>
-                '''
-                conn.sendall(html)
-                conn.close()
-                
-                time.sleep(1)
-                perform_system_reboot()
-        
-    except OSError as e:
-        if e.args[0] not in [11, 110, 115]:
+        with open(UPLOAD_QUEUE_FILE, "r") as f:
+            for line in f:
+                name = line.strip()
+                if name and name not in upload_pending:
+                    upload_pending.append(name)
+        upload_queue_saved = True
+        print(f"  Upload queue: {len(upload_pending)} photos waiting")
+    except OSError:
+        pass
+
+def save_upload_queue():
+    """Write the pending list to SD (or remove the file when it is empty)"""
+    global upload_queue_saved
+    try:
+        if upload_pending:
+            with open(UPLOAD_QUEUE_FILE, "w") as f:
+                for name in upload_pending:
+                    f.write(name + "\n")
+            upload_queue_saved = True
+        elif upload_queue_saved:
+            uos.remove(UPLOAD_QUEUE_FILE)
+            upload_queue_saved = False
+    except Exception as e:
+        print(f"Could not save upload queue: {e}")
+
+def upload_close():
+    """Drop the current upload and the connection"""
+    global upload_job, upload_sock
+    if upload_job is not None:
+        try:
+            upload_job["file"].close()
+        except:
+            pass
+        upload_job = None
+    if upload_sock is not None:
+        try:
+            upload_sock.close()
+        except:
             pass
+        upload_sock = None
+
+def upload_reset():
+    """Forget everything queued (used after Format SD)"""
+    global upload_queue_saved, upload_backoff, upload_retry_at
+    upload_close()
+    upload_pending.clear()
+    upload_queue_saved = False
+    upload_backoff = 0
+    upload_retry_at = 0
+
+def upload_start(filename):
+    """Open the photo on SD, start connecting if needed and queue the headers"""
+    global upload_job, upload_sock, upload_addr
+    host, port, path = parse_upload_url(UPLOAD_URL)
+    try:
+        f = open(PHOTO_FOLDER + "/" + filename, "rb")
+    except OSError as e:
+        if e.args[0] == 2:
+            # Photo was deleted since it was queued, nothing to send
+            upload_pending.pop(0)
+            return
+        raise
+
+    # One format string: MicroPython 1.21 can't join adjacent f-strings
+    head = ("POST %s HTTP/1.1\r\nHost: %s:%d\r\nConnection: keep-alive\r\n"
+            "Content-Type: image/jpeg\r\nTransfer-Encoding: chunked\r\n"
+            "X-Device: %s\r\nX-Filename: %s\r\n\r\n"
+            % (path, host, port, DEVICE_NAME, filename))
+    upload_job = {
+        "name": filename,
+        "file": f,
+        "reused": upload_sock is not None,
+        "state": "send",
+        "out": memoryview(head.encode()),
+        "sent": 0,
+        # Room for the chunk size line in front and CRLF behind each slice
+        "buf": bytearray(UPLOAD_CHUNK_SIZE + 10),
+        "body_done": False,
+        "resp": b"",
+        "deadline": utime.ticks_add(utime.ticks_ms(), UPLOAD_TIMEOUT_S * 1000),
+    }
+    if upload_sock is None:
+        if upload_addr is None:
+            upload_addr = socket.getaddrinfo(host, port)[0][-1]
+        upload_sock = socket.socket()
+        upload_sock.setblocking(False)
+        try:
+            upload_sock.connect(upload_addr)
+        except OSError as e:
+            if e.args[0] not in WOULD_BLOCK:
+                raise
+        # Connected once the socket turns writable
+        upload_job["state"] = "connect"
+        upload_job["poll"] = select.poll()
+        upload_job["poll"].register(upload_sock, select.POLLOUT)
+
+def upload_check_connect():
+    """See whether the non-blocking connect has finished"""
+    job = upload_job
+    for item in job["poll"].poll(0):
+        if item[1] & (select.POLLERR | select.POLLHUP):
+            raise OSError("could not connect")
+        if item[1] & select.POLLOUT:
+            job["poll"] = None
+            job["state"] = "send"
+            job["deadline"] = utime.ticks_add(utime.ticks_ms(), UPLOAD_TIMEOUT_S * 1000)
+            return
+    if utime.ticks_diff(utime.ticks_ms(), job["deadline"]) > 0:
+        raise OSError("connect timed out")
+
+def upload_next_slice():
+    """Queue the next slice of the photo as one HTTP chunk, or the final chunk"""
+    job = upload_job
+    buf = job["buf"]
+    n = job["file"].readinto(memoryview(buf)[8:8 + UPLOAD_CHUNK_SIZE])
+    if not n:
+        job["file"].close()
+        job["body_done"] = True
+        job["out"] = memoryview(b"0\r\n\r\n")
+        return
+    size_line = ("%x\r\n" % n).encode()
+    start = 8 - len(size_line)
+    buf[start:8] = size_line
+    buf[8 + n:10 + n] = b"\r\n"
+    job["out"] = memoryview(buf)[start:10 + n]
+
+def upload_send():
+    """Send as much of the current slice as the socket takes right now"""
+    job = upload_job
+    try:
+        sent = upload_sock.send(job["out"][job["sent"]:])
+    except OSError as e:
+        if e.args[0] not in WOULD_BLOCK:
+            raise
+        sent = 0
+    now = utime.ticks_ms()
+    if sent:
+        job["sent"] += sent
+        job["deadline"] = utime.ticks_add(now, UPLOAD_TIMEOUT_S * 1000)
+    elif utime.ticks_diff(now, job["deadline"]) > 0:
+        raise OSError("send stalled")
+    if job["sent"] < len(job["out"]):
+        return
+    job["sent"] = 0
+    if not job["body_done"]:
+        upload_next_slice()
+        return
+    job["state"] = "response"
+    job["out"] = None
+    job["buf"] = None
+    job["deadline"] = utime.ticks_add(now, UPLOAD_TIMEOUT_S * 1000)
+
+def upload_read_response():
+    """Poll for the receiver's reply without blocking the main loop"""
+    global upload_job, upload_backoff, upload_sent
+    job = upload_job
+    try:
+        data = upload_sock.recv(256)
+    except OSError as e:
+        if e.args[0] not in WOULD_BLOCK:
+            raise
+        if utime.ticks_diff(utime.ticks_ms(), job["deadline"]) > 0:
+            raise OSError(errno.ETIMEDOUT)
+        return
+    if not data:
+        raise OSError("receiver closed the connection")
+
+    job["resp"] += data
+    head_end = job["resp"].find(b"\r\n\r\n")
+    if head_end < 0:
+        return
+    head = job["resp"][:head_end].decode()
+    lines = head.split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    content_length = 0
+    keep_alive = True
+    for line in lines[1:]:
+        key, _, value = line.partition(":")
+        key = key.strip().lower()
+        if key == "content-length":
+            content_length = int(value.strip())
+        elif key == "connection" and value.strip().lower() == "close":
+            keep_alive = False
+    if len(job["resp"]) - head_end - 4 < content_length:
+        return
+
+    if status != 200:
+        raise OSError(f"receiver answered {status}")
+
+    print(f"Uploaded {job['name']}")
+    upload_pending.pop(0)
+    upload_sent += 1
+    upload_backoff = 0
+    upload_job = None
+    if not keep_alive:
+        upload_close()
+    if upload_queue_saved and (not upload_pending or upload_sent % 10 == 0):
+        save_upload_queue()
+
+def upload_error(e):
+    """Close everything and schedule a retry with backoff"""
+    global upload_backoff, upload_retry_at, upload_failed_count
+    reused = upload_job is not None and upload_job["reused"]
+    upload_close()
+    if reused:
+        # Idle keep-alive connection was dropped by the PC: reconnect right away
+        return
+    upload_failed_count += 1
+    upload_backoff = min(max(1, upload_backoff * 2), UPLOAD_BACKOFF_MAX_S)
+    upload_retry_at = utime.ticks_add(utime.ticks_ms(), upload_backoff * 1000)
+    print(f"Upload failed ({e}), retrying in {upload_backoff}s, {len(upload_pending)} queued")
+    if not upload_queue_saved:
+        save_upload_queue()
+
+def service_uploads():
+    """Do one small slice of upload work, called from the main loop"""
+    if not UPLOAD_URL or (upload_job is None and not upload_pending):
+        return
+    if upload_job is None and utime.ticks_diff(upload_retry_at, utime.ticks_ms()) > 0:
+        return
+    try:
+        if upload_job is None:
+            upload_start(upload_pending[0])
+        elif upload_job["state"] == "connect":
+            upload_check_connect()
+        elif upload_job["state"] == "send":
+            upload_send()
         else:
-            # Close connection if it's still open
-            try:
-                conn.close()
-            except:
-                pass
-            
+            upload_read_response()
     except Exception as e:
-        if "timed out" not in str(e) and "timeout" not in str(e):
-            print(f"Web request error: {e}")
-        # Close connection on any error
+        upload_error(e)
+# ==========================
+
+# === SD SPACE AND RETENTION ===
+# Free space comes from statvfs every FREE_SPACE_REFRESH_S and is counted
+# down by each saved frame in between, so nothing is queried per photo.
+def refresh_free_space():
+    global free_bytes, cluster_bytes, card_bytes, free_refreshed_at
+    free_refreshed_at = utime.ticks_ms()
+    try:
+        st = uos.statvfs(SD_MOUNT_POINT)
+        cluster_bytes = st[0] or cluster_bytes
+        free_bytes = st[0] * st[4]
+        card_bytes = st[0] * st[2]
+    except Exception as e:
+        print(f"Could not read free space: {e}")
+
+def on_card_bytes(size):
+    """Space a file really takes: whole clusters"""
+    return (size + cluster_bytes - 1) // cluster_bytes * cluster_bytes
+
+def retention_enabled():
+    return RETAIN_MIN_FREE_MB or RETAIN_MAX_FRAMES or RETAIN_MAX_SESSIONS
+
+def min_free_bytes():
+    """RETAIN_MIN_FREE_MB, capped at a tenth of the card so a small card
+    isn't emptied to reach a floor it can never have"""
+    floor = RETAIN_MIN_FREE_MB * 1024 * 1024
+    if card_bytes:
+        floor = min(floor, card_bytes // 10)
+    return floor
+
+def retention_floor():
+    """Free bytes below which the oldest photos start being deleted"""
+    return min_free_bytes() + RETENTION_HEADROOM_FRAMES * avg_frame_bytes
+
+def frames_remaining():
+    """Projected photos that still fit above the free-space floor"""
+    if free_bytes is None or not avg_frame_bytes:
+        return None
+    usable = free_bytes - min_free_bytes()
+    return max(0, usable // on_card_bytes(avg_frame_bytes))
+
+def note_frame_saved(size):
+    """Account for a new photo and decide whether retention needs to run"""
+    global avg_frame_bytes, photo_total, photo_bytes, last_frame_time, retention_due
+    now = time.time()
+    if last_frame_time is None or now - last_frame_time > SESSION_GAP_S:
+        retention_due = True  # a new print started (or the first photo since boot)
+    last_frame_time = now
+    photo_total += 1
+    if photo_bytes is not None:
+        photo_bytes += size
+    avg_frame_bytes = size if not avg_frame_bytes else (avg_frame_bytes * 7 + size) // 8
+    note_space_used(size)
+    if RETAIN_MAX_FRAMES and photo_total > RETAIN_MAX_FRAMES:
+        retention_due = True
+
+def note_space_used(size):
+    """Count a file written to the card against the free space estimate"""
+    global free_bytes, retention_due
+    if free_bytes is not None:
+        free_bytes -= on_card_bytes(size)
+        if RETAIN_MIN_FREE_MB and free_bytes < retention_floor():
+            retention_due = True
+
+def photo_time(name):
+    """Capture time from photo_NNNN_YYYY-MM-DD_HH-MM-SS.jpg (seconds)"""
+    try:
+        return utime.mktime((int(name[11:15]), int(name[16:18]), int(name[19:21]),
+                             int(name[22:24]), int(name[25:27]), int(name[28:30]), 0, 0))
+    except:
+        return None
+
+def plan_retention():
+    """Pick the oldest photos to delete so every retention limit holds again"""
+    global retention_queue, avg_frame_bytes
+    photos = list_photos()
+    if not avg_frame_bytes and photos:
+        # Nothing saved since boot yet: size the estimate from the newest photo
         try:
-            conn.close()
-        except:
+            avg_frame_bytes = os.stat(PHOTO_FOLDER + "/" + photos[-1])[6]
+        except OSError:
+            pass
+    victims = 0
+    if RETAIN_MAX_FRAMES and len(photos) > RETAIN_MAX_FRAMES:
+        victims = len(photos) - RETAIN_MAX_FRAMES
+    if RETAIN_MAX_SESSIONS:
+        starts = [0]
+        last = None
+        for i, name in enumerate(photos):
+            t = photo_time(name)
+            # The clock restarts at 2000-01-01 on every power-up (no NTP), so
+            # time going backwards is a new print too, like tools/photolog.py
+            if t is not None and last is not None and (t - last > SESSION_GAP_S or t < last):
+                starts.append(i)
+            if t is not None:
+                last = t
+        if len(starts) > RETAIN_MAX_SESSIONS:
+            victims = max(victims, starts[-RETAIN_MAX_SESSIONS])
+    if RETAIN_MIN_FREE_MB and free_bytes is not None and avg_frame_bytes:
+        need = retention_floor() - free_bytes
+        if need > 0:
+            # Overshoot by a batch so deleting happens in batches, not every frame
+            victims = max(victims, need // on_card_bytes(avg_frame_bytes) + RETENTION_BATCH)
+    # Never delete the photo that was just taken
+    victims = min(victims, len(photos) - 1)
+    retention_queue = photos[:victims] if victims > 0 else []
+    if retention_queue:
+        print(f"Retention: deleting {len(retention_queue)} oldest photos in the background")
+
+def evict_batch(count):
+    """Delete up to count photos from the front of the retention queue"""
+    global free_bytes, photo_total, photo_bytes
+    deleted = 0
+    freed = 0
+    names = []
+    while retention_queue and deleted < count:
+        name = retention_queue.pop(0)
+        path = PHOTO_FOLDER + "/" + name
+        try:
+            size = os.stat(path)[6]
+            uos.remove(path)
+        except OSError:
+            continue
+        deleted += 1
+        names.append(name)
+        freed += on_card_bytes(size)
+        photo_total -= 1
+        if photo_bytes is not None:
+            photo_bytes -= size
+    if names:
+        freed += evict_burst_extras(names)
+    if free_bytes is not None:
+        free_bytes += freed
+    if deleted:
+        print(f"Retention: deleted {deleted} photos, {freed // 1024} KB freed")
+        send_event("evicted", {"count": deleted, "bytes": freed})
+    if not retention_queue:
+        refresh_free_space()
+    return deleted
+
+def evict_burst_extras(names):
+    """Delete the kept burst frames that belong to evicted photos. Matched by
+    the photo_NNNN_b prefix, so frames from a larger BURST_FRAMES go too."""
+    try:
+        extras = uos.listdir(BURST_FOLDER)
+    except OSError:
+        return 0  # burst frames were never kept
+    evicted = set(name[:10] for name in names)
+    freed = 0
+    for extra in extras:
+        if extra[:10] not in evicted or extra[10:12] != "_b":
+            continue
+        path = BURST_FOLDER + "/" + extra
+        try:
+            size = os.stat(path)[6]
+            uos.remove(path)
+            freed += on_card_bytes(size)
+        except OSError:
             pass
+    return freed
+
+def make_room_now():
+    """Synchronous eviction for when a capture would otherwise not fit"""
+    if not retention_queue:
+        plan_retention()
+    if not retention_queue and RETAIN_MIN_FREE_MB and photo_total > 1:
+        # Limits say nothing needs to go, but the card is full anyway
+        retention_queue.extend(list_photos()[:RETENTION_BATCH])
+    evict_batch(RETENTION_BATCH)
+
+def service_retention():
+    """Background work: refresh free space, plan and delete in small batches"""
+    global retention_due
+    if retention_queue:
+        evict_batch(RETENTION_BATCH)
+    elif retention_due:
+        retention_due = False
+        if retention_enabled():
+            plan_retention()
+    elif utime.ticks_diff(utime.ticks_ms(), free_refreshed_at) > FREE_SPACE_REFRESH_S * 1000:
+        refresh_free_space()
+        if (RETAIN_MIN_FREE_MB and last_frame_time is not None
+                and free_bytes is not None and free_bytes < retention_floor()):
+            retention_due = True
+
+def retention_reset():
+    """Start over after Format SD"""
+    global retention_due, last_frame_time, photo_total, photo_bytes
+    retention_queue.clear()
+    photo_total = 0
+    photo_bytes = None
+    last_frame_time = None
+    retention_due = False
+    refresh_free_space()
+# ==============================
+
+# === LIVE UPDATES (SSE) ===
+# Each open dashboard keeps one /events connection. Events are queued per
+# client and written with non-blocking sends from the main loop; a client
+# that falls SSE_MAX_BUFFER bytes behind is dropped instead of slowing us down.
+def open_event_stream(conn):
+    """Turn an accepted /events request into a live event stream"""
+    if len(sse_clients) >= SSE_MAX_CLIENTS:
+        # Usually a dashboard that was reloaded or closed: newest one wins
+        sse_drop(sse_clients[0])
+    conn.setblocking(False)
+    data = json.dumps({"next": picture_count})
+    # Headers go out through the same non-blocking queue as the events
+    hello = ("HTTP/1.1 200 OK\r\n"
+             "Content-Type: text/event-stream\r\n"
+             "Cache-Control: no-cache\r\n\r\n"
+             f"retry: 3000\nevent: hello\ndata: {data}\n\n")
+    sse_clients.append([conn, hello.encode()])
+    print(f"Live update clients: {len(sse_clients)}")
+
+def sse_drop(client):
+    try:
+        client[0].close()
+    except:
+        pass
+    if client in sse_clients:
+        sse_clients.remove(client)
+    print(f"Live update client dropped, {len(sse_clients)} left")
+
+def send_event(kind, data):
+    """Queue an event for every open dashboard and try to send it right away"""
+    if not sse_clients:
+        return
+    msg = f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode()
+    for client in sse_clients[:]:
+        if len(client[1]) + len(msg) > SSE_MAX_BUFFER:
+            sse_drop(client)
+        else:
+            client[1] += msg
+    service_sse()
+
+def service_sse():
+    """Push queued event bytes without blocking, called from the main loop"""
+    global sse_last_heartbeat
+    if not sse_clients:
+        return
+    now = utime.ticks_ms()
+    if utime.ticks_diff(now, sse_last_heartbeat) > SSE_HEARTBEAT_S * 1000:
+        # Comment line: keeps proxies quiet and finds dead clients
+        sse_last_heartbeat = now
+        for client in sse_clients:
+            if len(client[1]) < SSE_MAX_BUFFER:
+                client[1] += b": ping\n\n"
+    for client in sse_clients[:]:
+        if not client[1]:
+            continue
+        try:
+            sent = client[0].send(client[1])
+            client[1] = client[1][sent:]
+        except OSError as e:
+            if e.args[0] not in WOULD_BLOCK:
+                sse_drop(client)
+# ==========================
+
+# === WEB SERVER ===
+# All sockets are non-blocking and watched with select.poll. Each connection
+# is a small state machine (read request -> write reply -> close) that gets a
+# slice of work per main loop pass, so a slow or idle browser can never hold
+# up the shutter. Past WEB_MAX_CONNECTIONS new clients get a quick 503, and
+# past twice that they are closed without a reply.
+
+def page_take_photo():
+    """Page shown by /takePhoto when the dashboard script is not used"""
+    return '''
+        <html>
+        <head>
+            <meta http-equiv="refresh" content="3;url=/">
+            <style>
+                body { font-family: Arial; margin: 40px; text-align: center; }
+                .spinner {
+                    border: 8px solid #f3f3f3;
+                    border-top: 8px solid #3498db;
+                    border-radius: 50%;
+                    width: 60px;
+                    height: 60px;
+                    animation: spin 2s linear infinite;
+                    margin: 20px auto;
+                }
+                @keyframes spin {
+                    0% { transform: rotate(0deg); }
+                    100% { transform: rotate(360deg); }
+                }
+            </style>
+        </head>
+        <body>
+            <h1>Taking Photo...</h1>
+            <div class="spinner"></div>
+            <p>Please wait while the photo is being taken.</p>
+            <p>You will be redirected back to the main page in a few seconds.</p>
+        </body>
+        </html>
+        '''
+
+def page_format():
+    """Format the card and build the result page"""
+    success, deleted, errors = format_sd_card()
+    
+    if success:
+        message = f"SD Card Formatted!<br>"
+        message += f"Deleted {deleted} items"
+        if errors > 0:
+            message += f"<br>({errors} items could not be deleted)"
+        
+        html = f"""
+        <html><body style="font-family: Arial; margin: 40px; text-align: center;">
+        <h1>{message}</h1>
+        <p>Ready for new photos.</p>
+        <button onclick="location.href='/'" style="padding: 10px 20px; background: #4CAF50; color: white; border: none; border-radius: 4px; cursor: pointer;">
+            Back to Main Page
+        </button>
+        <script>setTimeout(function(){{ location.href="/"; }}, 5000);</script>
+        </body></html>
+        """
+    else:
+        html = f"""
+        <html><body style="font-family: Arial; margin: 40px; text-align: center;">
+        <h1>Format Failed</h1>
+        <p>Could not format SD card.</p>
+        <p>Try physically removing and reinserting the SD card.</p>
+        <button onclick="location.href='/'" style="padding: 10px 20px; background: #2196F3; color: white; border: none; border-radius: 4px; cursor: pointer;">
+            Back
+        </button>
+        </body></html>
+        """
+    return html
+
+def page_sync():
+    """Sync the card and build the result page"""
+    success = sync_filesystem()
+    send_event("sync", {"ok": success})
+    
+    if success:
+        html = """
+        <html><body style="font-family: Arial; margin: 40px; text-align: center;">
+        <h1>Filesystem Synced!</h1>
+        <p>It is now safe to power off the ESP32.</p>
+        <p><strong>Wait 10 seconds</strong> after seeing this message before removing power.</p>
+        <button onclick="location.href='/'" style="padding: 10px 20px; background: #4CAF50; color: white; border: none; border-radius: 4px; cursor: pointer;">
+            Back to Main Page
+        </button>
+        <script>setTimeout(function(){ location.href="/"; }, 10000);</script>
+        </body></html>
+        """
+    else:
+        html = """
+        <html><body style="font-family: Arial; margin: 40px; text-align: center;">
+        <h1>Sync Failed</h1>
+        <p>Could not sync filesystem. Wait 30 seconds before powering off.</p>
+        <button onclick="location.href='/'" style="padding: 10px 20px; background: #2196F3; color: white; border: none; border-radius: 4px; cursor: pointer;">
+            Back
+        </button>
+        </body></html>
+        """
+    return html
+
+def reboot_after_reply():
+    time.sleep(1)
+    perform_system_reboot()
+
+def page_reboot():
+    return '''
+        <html>
+        <body style="font-family: Arial; margin: 40px; text-align: center;">
+        <h1>Rebooting Camera...</h1>
+        <p>The camera is now restarting.</p>
+        <p>Please wait 10-15 seconds and refresh the page.</p>
+        <p><a href="/">Click here if not redirected in 15 seconds</a></p>
+        <script>
+            setTimeout(function() {
+                location.href = "/";
+            }, 15000);
+        </script>
+        </body>
+        </html>
+        '''
+
+def web_close(conn):
+    """Forget a connection and close its socket"""
+    try:
+        web_poller.unregister(conn["sock"])
+    except:
+        pass
+    try:
+        conn["sock"].close()
+    except:
+        pass
+    if conn in web_conns:
+        web_conns.remove(conn)
+
+def web_close_all():
+    for conn in web_conns[:]:
+        web_close(conn)
+
+def web_respond(conn, status, body, after=None, headers="", content_type="text/html"):
+    """Queue a complete reply; write_response() sends it a slice at a time"""
+    if isinstance(body, str):
+        body = body.encode()
+    head = ("HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n"
+            "%sConnection: close\r\n\r\n" % (status, content_type, len(body), headers))
+    conn["out"] = memoryview(head.encode() + body)
+    conn["sent"] = 0
+    conn["after"] = after
+    conn["state"] = "write"
+    conn["deadline"] = utime.ticks_add(utime.ticks_ms(), WEB_SEND_TIMEOUT_MS)
+    web_poller.modify(conn["sock"], select.POLLOUT)
+
+def dashboard_asset(name, data):
+    """The built-in copy of a dashboard file, or the one from ASSET_FOLDER"""
+    if data is not None:
+        return data
+    with open(ASSET_FOLDER + "/" + name, "rb") as f:
+        return f.read()
+
+def send_asset(conn, name, data, content_type):
+    try:
+        body = dashboard_asset(name, data)
+    except OSError:
+        print(f"Missing {ASSET_FOLDER}/{name}, upload build/bundle/www too")
+        web_respond(conn, "404 Not Found", "")
+        return
+    web_respond(conn, "200 OK", body, headers="Cache-Control: max-age=86400\r\n",
+                content_type=content_type)
+
+def dispatch_request(conn, request_str):
+    """Route a complete request"""
+    line = request_str.split("\r\n", 1)[0]
+    parts = line.split(" ")
+    if len(parts) < 2 or parts[0] != "GET":
+        web_respond(conn, "405 Method Not Allowed", "")
+        return
+    path = parts[1]
+    print(f"Client {conn['addr']}: {path}")
+    
+    if path.startswith("/events"):
+        # Hand the socket over to the live update code, which keeps it open
+        web_poller.unregister(conn["sock"])
+        web_conns.remove(conn)
+        open_event_stream(conn["sock"])
+    elif path == "/" or path.startswith("/?"):
+        web_respond(conn, "200 OK", web_page())
+    elif path.startswith("/app.css"):
+        send_asset(conn, "app.css", DASHBOARD_CSS, "text/css")
+    elif path.startswith("/app.js"):
+        send_asset(conn, "app.js", DASHBOARD_JS, "application/javascript")
+    elif path.startswith("/takePhoto"):
+        # The main loop takes the photo right after this request
+        print("Web photo requested")
+        queue_trigger("web")
+        web_respond(conn, "200 OK", page_take_photo())
+    elif path.startswith("/format"):
+        web_respond(conn, "200 OK", page_format())
+    elif path.startswith("/sync"):
+        web_respond(conn, "200 OK", page_sync())
+    elif path.startswith("/reboot"):
+        web_respond(conn, "200 OK", page_reboot(), after=reboot_after_reply)
+    else:
+        web_respond(conn, "404 Not Found", "<html><body>Not found</body></html>")
+
+def read_request(conn):
+    """Collect request bytes until the headers are complete"""
+    try:
+        data = conn["sock"].recv(512)
+    except OSError as e:
+        if e.args[0] in WOULD_BLOCK:
+            return
+        web_close(conn)
+        return
+    if not data:
+        web_close(conn)
+        return
+    conn["in"] += data
+    if len(conn["in"]) > WEB_MAX_REQUEST:
+        web_respond(conn, "431 Request Header Fields Too Large", "")
+        return
+    if b"\r\n\r\n" in conn["in"] or b"\n\n" in conn["in"]:
+        request_str = conn["in"].decode()
+        conn["in"] = b""
+        if conn["busy"]:
+            # Read the request first: closing on unread data sends a reset, not the 503
+            web_respond(conn, "503 Service Unavailable", "", headers="Retry-After: 2\r\n")
+            return
+        try:
+            dispatch_request(conn, request_str)
+        except Exception as e:
+            print(f"Web request error: {e}")
+            web_close(conn)
+
+def write_response(conn):
+    """Send as much of the reply as the socket takes right now"""
+    out = conn["out"]
+    try:
+        conn["sent"] += conn["sock"].send(out[conn["sent"]:])
+    except OSError as e:
+        if e.args[0] not in WOULD_BLOCK:
+            web_close(conn)
+        return
+    if conn["sent"] >= len(out):
+        after = conn["after"]
+        web_close(conn)
+        if after:
+            after()
+
+def accept_connections():
+    """Take new clients off the listening socket, shedding load past the limit"""
+    while True:
+        try:
+            sock, addr = s.accept()
+        except OSError as e:
+            # No more waiting clients is normal; anything else means the socket is broken
+            if e.args[0] not in WOULD_BLOCK and "timed out" not in str(e):
+                report_health("socket", False)
+            return
+        report_health("socket", True)
+        sock.setblocking(False)
+        
+        if len(web_conns) >= 2 * WEB_MAX_CONNECTIONS:
+            sock.close()
+            continue
+        busy = sum(1 for c in web_conns if not c["busy"]) >= WEB_MAX_CONNECTIONS
+        if busy:
+            print(f"Busy, turning away {addr[0]}")
+        
+        web_conns.append({
+            "sock": sock,
+            "addr": addr[0],
+            "busy": busy,
+            "state": "read",
+            "in": b"",
+            "deadline": utime.ticks_add(utime.ticks_ms(), WEB_HEADER_TIMEOUT_MS),
+        })
+        web_poller.register(sock, select.POLLIN)
+
+def handle_web_requests():
+    """Give every ready connection one slice of work, never waiting on a client"""
+    now = utime.ticks_ms()
+    for conn in web_conns[:]:
+        if utime.ticks_diff(now, conn["deadline"]) > 0:
+            print(f"Client {conn['addr']} too slow, dropped")
+            web_close(conn)
+    
+    for item in web_poller.poll(0):
+        sock, event = item[0], item[1]
+        if sock is s:
+            accept_connections()
+            continue
+        conn = None
+        for c in web_conns:
+            if c["sock"] is sock:
+                conn = c
+                break
+        if conn is None:
+            continue
+        if event & (select.POLLHUP | select.POLLERR):
+            web_close(conn)
+        elif conn["state"] == "read":
+            read_request(conn)
+        else:
+            write_response(conn)
+# ==================
+
+# === TRIGGER QUEUE ===
+def queue_trigger(source):
+    """Queue a capture request; layer triggers close together are merged into one"""
+    global last_trigger_ms, last_interval_ms
+    now = utime.ticks_ms()
+    if source in ["web", "interval"]:
+        # Never merged (the schedule might skip the layer trigger it would be
+        # merged into) and not part of the layer rhythm
+        if source == "interval":
+            last_interval_ms = now
+        trigger_queue.append((source, now))
+        return True
+    if last_trigger_ms is not None and utime.ticks_diff(now, last_trigger_ms) < TRIGGER_DEDUP_MS:
+        print(f"Trigger from {source} merged with the previous one")
+        return False
+    if last_trigger_ms is not None:
+        trigger_gaps_ms.append(utime.ticks_diff(now, last_trigger_ms))
+        if len(trigger_gaps_ms) > 8:
+            trigger_gaps_ms.pop(0)
+    last_trigger_ms = now
+    trigger_queue.append((source, now))
+    return True
+
+def should_capture(source):
+    """Apply the capture schedule to one trigger"""
+    global trigger_count
+    if source in ["web", "interval"]:
+        return True  # asked for explicitly, or the fallback timer itself
+    trigger_count += 1
+    if CAPTURE_EVERY_NTH > 1 and trigger_count % CAPTURE_EVERY_NTH != 0:
+        print(f"  Skipped: photo every {CAPTURE_EVERY_NTH} triggers ({trigger_count})")
+        return False
+    if CAPTURE_MIN_INTERVAL_S and last_capture_ms is not None:
+        since_ms = utime.ticks_diff(utime.ticks_ms(), last_capture_ms)
+        if since_ms < CAPTURE_MIN_INTERVAL_S * 1000:
+            print(f"  Skipped: only {since_ms} ms since the last photo")
+            return False
+    return True
+
+def process_triggers():
+    """Run the schedule on one queued trigger and capture if it says so"""
+    global last_trigger_source, last_trigger_latency_ms, last_capture_ms
+    if not trigger_queue:
+        if CAPTURE_FALLBACK_S:
+            now = utime.ticks_ms()
+            idle_since = last_trigger_ms if last_trigger_ms is not None else boot_ticks
+            if last_interval_ms is not None and utime.ticks_diff(last_interval_ms, idle_since) > 0:
+                idle_since = last_interval_ms
+            if utime.ticks_diff(now, idle_since) > CAPTURE_FALLBACK_S * 1000:
+                print(f"\nNo trigger for {CAPTURE_FALLBACK_S}s, taking an interval photo")
+                queue_trigger("interval")
+        return
+    source, queued_ms = trigger_queue.pop(0)
+    print(f"\nTrigger: {source}")
+    if not should_capture(source):
+        return
+    if take_photo():
+        last_capture_ms = utime.ticks_ms()
+        last_trigger_source = source
+        last_trigger_latency_ms = utime.ticks_diff(last_capture_ms, queued_ms)
+        print(f"  Trigger to saved photo: {last_trigger_latency_ms} ms")
+
+def background_allowed():
+    """True in the quiet part between layers, when uploads and clean-up may run"""
+    if trigger_queue:
+        return False
+    if last_trigger_ms is None or not trigger_gaps_ms:
+        return True  # no rhythm to predict yet
+    since_ms = utime.ticks_diff(utime.ticks_ms(), last_trigger_ms)
+    # Shortest recent gap: the earliest the next layer is likely to arrive
+    until_next_ms = min(trigger_gaps_ms) - since_ms
+    return not (0 < until_next_ms <= QUIET_GUARD_MS)
 
 def check_shutter():
-    global last_shutter_state
+    global last_shutter_state, last_shutter_press
     current_state = shutter.value()
     
     if last_shutter_state == 1 and current_state == 0:
-        print("\nShutter button pressed!")
-        take_photo()
-        time.sleep(0.5)
+        now = utime.ticks_ms()
+        # Ignore switch bounce instead of sleeping in the main loop
+        if last_shutter_press is None or utime.ticks_diff(now, last_shutter_press) >= SHUTTER_DEBOUNCE_MS:
+            last_shutter_press = now
+            print("\nShutter button pressed!")
+            queue_trigger("switch")
     
     last_shutter_state = current_state
+# =====================
 
-def main():
-    """Main program function"""
+# === MQTT LAYER TRIGGER ===
+# Just enough MQTT 3.1.1 to subscribe to device/<serial>/report and watch
+# "layer_num". The socket is non-blocking from the connect on, so the switch
+# is still polled while the printer is unreachable or slow to answer.
+# CONNECT and SUBSCRIBE go out together (MQTT allows sending before CONNACK).
+# The TLS handshake is spread over later reads/writes as well, but its key
+# exchange is seconds of CPU work on the ESP32 that can't be split, so a
+# (re)connect only moves on in the quiet window between layers.
+def mqtt_encode_str(value):
+    data = value.encode()
+    return bytes([len(data) >> 8, len(data) & 0xFF]) + data
+
+def mqtt_packet(header, body):
+    """Build a packet: fixed header byte + remaining length + body"""
+    out = bytearray([header])
+    n = len(body)
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        out.append(byte | 0x80 if n else byte)
+        if not n:
+            break
+    return bytes(out) + body
+
+def mqtt_close():
+    global mqtt_sock, mqtt_state, mqtt_poller, mqtt_out, mqtt_buf, mqtt_skip
+    if mqtt_sock is not None:
+        try:
+            mqtt_sock.close()
+        except:
+            pass
+    mqtt_sock = None
+    mqtt_state = None
+    mqtt_poller = None
+    mqtt_out = b""
+    mqtt_buf = b""
+    mqtt_skip = 0
+
+def mqtt_connect():
+    """Start a non-blocking connect to the printer's broker"""
+    global mqtt_sock, mqtt_state, mqtt_poller, mqtt_deadline, mqtt_addr
+    print(f"Connecting to printer MQTT at {PRINTER_IP}:{MQTT_PORT}...")
+    if mqtt_addr is None:
+        mqtt_addr = socket.getaddrinfo(PRINTER_IP, MQTT_PORT)[0][-1]
+    mqtt_sock = socket.socket()
+    mqtt_sock.setblocking(False)
+    try:
+        mqtt_sock.connect(mqtt_addr)
+    except OSError as e:
+        if e.args[0] not in WOULD_BLOCK:
+            raise
+    mqtt_state = "connecting"
+    mqtt_poller = select.poll()
+    mqtt_poller.register(mqtt_sock, select.POLLOUT)
+    mqtt_deadline = utime.ticks_add(utime.ticks_ms(), MQTT_CONNECT_TIMEOUT_S * 1000)
+
+def mqtt_check_connect():
+    """Once TCP is up, start TLS and queue CONNECT + SUBSCRIBE"""
+    global mqtt_sock, mqtt_state, mqtt_poller, mqtt_out
+    ready = False
+    for item in mqtt_poller.poll(0):
+        if item[1] & (select.POLLERR | select.POLLHUP):
+            raise OSError("could not connect")
+        ready = True
+    if not ready:
+        if utime.ticks_diff(utime.ticks_ms(), mqtt_deadline) > 0:
+            raise OSError("connect timed out")
+        return
+    mqtt_poller = None
+    if MQTT_TLS:
+        import ssl
+        # The printer uses a self-signed certificate. No handshake here:
+        # it runs as mqtt_poll() reads and writes the non-blocking socket
+        mqtt_sock = ssl.wrap_socket(mqtt_sock, do_handshake=False)
+
+    flags = 0x02  # clean session
+    login = b""
+    if PRINTER_ACCESS_CODE:
+        flags |= 0xC0  # username + password
+        login = mqtt_encode_str("bblp") + mqtt_encode_str(PRINTER_ACCESS_CODE)
+    body = mqtt_encode_str("MQTT") + bytes([4, flags, MQTT_KEEPALIVE_S >> 8, MQTT_KEEPALIVE_S & 0xFF])
+    body += mqtt_encode_str(DEVICE_NAME) + login
+    topic = f"device/{PRINTER_SERIAL}/report"
+    mqtt_out = (mqtt_packet(0x10, body)
+                + mqtt_packet(0x82, bytes([0, 1]) + mqtt_encode_str(topic) + bytes([0])))
+    mqtt_state = "connack"
+
+def mqtt_flush():
+    """Write queued bytes as far as the socket takes them"""
+    global mqtt_out
+    if mqtt_out:
+        n = mqtt_sock.write(mqtt_out)
+        if n:
+            mqtt_out = mqtt_out[n:]
+
+def mqtt_handle_connack(packet):
+    global mqtt_state, mqtt_backoff, mqtt_last_rx, mqtt_last_ping
+    if len(packet) < 2 or packet[1] != 0:
+        raise OSError(f"MQTT connect refused: {packet}")
+    mqtt_state = "up"
+    mqtt_backoff = 0
+    mqtt_last_rx = mqtt_last_ping = utime.ticks_ms()
+    print(f"Subscribed to device/{PRINTER_SERIAL}/report")
+
+def mqtt_handle_publish(header, packet):
+    """Fire a trigger when the reported layer number changes"""
+    global mqtt_layer
+    topic_len = (packet[0] << 8) | packet[1]
+    start = 2 + topic_len
+    if header & 0x06:
+        start += 2  # packet id (QoS 1/2)
+    payload = packet[start:]
+
+    key = payload.find(b'"layer_num":')
+    if key < 0:
+        return
+    pos = key + 12
+    while pos < len(payload) and payload[pos] == 0x20:
+        pos += 1
+    end = pos
+    while end < len(payload) and 0x30 <= payload[end] <= 0x39:
+        end += 1
+    if end == pos:
+        return
+    layer = int(payload[pos:end])
+
+    if layer != mqtt_layer:
+        if mqtt_layer is not None and layer > 0:
+            print(f"\nPrinter reports layer {layer}")
+            queue_trigger("mqtt")
+        mqtt_layer = layer
+
+def mqtt_poll():
+    """Read whatever arrived and handle complete packets"""
+    global mqtt_buf, mqtt_skip, mqtt_out, mqtt_last_rx, mqtt_last_ping
+    now = utime.ticks_ms()
+    mqtt_flush()
+    data = mqtt_sock.read(1024)
+    if data == b"":
+        raise OSError("broker closed the connection")
+    if data:
+        mqtt_last_rx = now
+        if mqtt_skip:
+            # Still discarding the tail of an oversized packet
+            drop = min(mqtt_skip, len(data))
+            mqtt_skip -= drop
+            data = data[drop:]
+        mqtt_buf += data
+
+    while len(mqtt_buf) >= 2:
+        length = 0
+        shift = 0
+        i = 1
+        complete = False
+        while i < len(mqtt_buf) and i <= 4:
+            byte = mqtt_buf[i]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            i += 1
+            if not byte & 0x80:
+                complete = True
+                break
+        if not complete:
+            break  # length bytes not all here yet
+        if length > MQTT_MAX_PACKET:
+            available = len(mqtt_buf) - i
+            mqtt_skip = max(0, length - available)
+            mqtt_buf = mqtt_buf[i + min(length, available):]
+            continue
+        if len(mqtt_buf) < i + length:
+            break
+        header = mqtt_buf[0]
+        if header & 0xF0 == 0x30:
+            mqtt_handle_publish(header, mqtt_buf[i:i + length])
+        elif header == 0x20:
+            mqtt_handle_connack(mqtt_buf[i:i + length])
+        mqtt_buf = mqtt_buf[i + length:]
+
+    if mqtt_state != "up":
+        if utime.ticks_diff(now, mqtt_deadline) > 0:
+            raise OSError("no CONNACK from broker")
+        return
+    if utime.ticks_diff(now, mqtt_last_rx) > MQTT_KEEPALIVE_S * 1500:
+        raise OSError("no data from broker")
+    if utime.ticks_diff(now, mqtt_last_ping) > MQTT_KEEPALIVE_S * 500:
+        mqtt_out += b"\xc0\x00"  # PINGREQ
+        mqtt_last_ping = now
+        mqtt_flush()
+
+def service_mqtt():
+    """Keep the MQTT subscription alive and read layer changes, called from the main loop"""
+    global mqtt_retry_at, mqtt_backoff
+    if not PRINTER_IP:
+        return
+    if mqtt_state != "up" and not background_allowed():
+        return  # the switch isn't read during the TLS key exchange
+    try:
+        if mqtt_sock is None:
+            if utime.ticks_diff(mqtt_retry_at, utime.ticks_ms()) > 0:
+                return
+            mqtt_connect()
+        elif mqtt_state == "connecting":
+            mqtt_check_connect()
+        else:
+            mqtt_poll()
+    except Exception as e:
+        mqtt_close()
+        mqtt_backoff = min(max(5, mqtt_backoff * 2), 60)
+        mqtt_retry_at = utime.ticks_add(utime.ticks_ms(), mqtt_backoff * 1000)
+        print(f"MQTT error ({e}), reconnecting in {mqtt_backoff}s")
+# ==========================
+
+# === WATCHDOG AND RECOVERY ===
+def feed_watchdog():
+    if wdt is not None:
+        wdt.feed()
+
+def start_watchdog():
+    global wdt
+    if WDT_TIMEOUT_MS and wdt is None:
+        wdt = machine.WDT(timeout=WDT_TIMEOUT_MS)
+        print(f"Watchdog started ({WDT_TIMEOUT_MS} ms)")
+
+def read_reset_info():
+    """Find out why we (re)started: hardware cause + reason saved before a deliberate reset"""
+    global reset_cause, previous_reset_reason
+    causes = {}
+    for name in ["PWRON_RESET", "HARD_RESET", "WDT_RESET", "DEEPSLEEP_RESET", "SOFT_RESET"]:
+        if hasattr(machine, name):
+            causes[getattr(machine, name)] = name
+    try:
+        cause = machine.reset_cause()
+        reset_cause = causes.get(cause, str(cause))
+    except:
+        pass
+    try:
+        with open(RESET_REASON_FILE, "r") as f:
+            previous_reset_reason = f.read().strip()
+        uos.remove(RESET_REASON_FILE)
+    except OSError:
+        pass
+    print(f"Reset cause: {reset_cause}")
+    if previous_reset_reason:
+        print(f"Previous reset reason: {previous_reset_reason}")
+
+def log_recovery(message):
+    """Append a line to the recovery log (best effort, SD may be the problem)"""
+    try:
+        with open(RECOVERY_LOG, "a") as f:
+            f.write(f"{get_formatted_time()} | {message}\n")
+    except:
+        pass
+
+def full_reset(reason):
+    """Last resort: remember why, then reset the board"""
+    print(f"\nFULL RESET: {reason}")
+    uptime_s = utime.ticks_diff(utime.ticks_ms(), boot_ticks) // 1000
+    try:
+        with open(RESET_REASON_FILE, "w") as f:
+            f.write(f"{reason} (after {uptime_s}s uptime)")
+    except:
+        pass
+    log_recovery(f"full reset: {reason}")
+    sync_filesystem()
+    machine.reset()
+
+def recover_camera():
+    try:
+        camera.deinit()
+    except:
+        pass
+    return init_camera()
+
+def recover_sd():
+    try:
+        uos.umount(SD_MOUNT_POINT)
+    except:
+        pass
+    return mount_sd_card() and setup_filesystem()
+
+def recover_socket():
     global s
+    try:
+        s.close()
+    except:
+        pass
+    start_web_server()
+    return True
+
+def recover(subsystem):
+    """Restart one subsystem; reset the board if that keeps happening"""
+    now = utime.ticks_ms()
+    recent = [t for t in recovery_history.get(subsystem, [])
+              if utime.ticks_diff(now, t) < RECOVERY_WINDOW_S * 1000]
+    if len(recent) >= MAX_SOFT_RECOVERIES:
+        full_reset(f"{subsystem} failed {len(recent)} recoveries in {RECOVERY_WINDOW_S}s")
+    recent.append(now)
+    recovery_history[subsystem] = recent
+
+    print(f"\nRecovering {subsystem}...")
+    feed_watchdog()
+    try:
+        ok = {"camera": recover_camera, "sd": recover_sd, "socket": recover_socket}[subsystem]()
+    except Exception as e:
+        print(f"  Recovery error: {e}")
+        ok = False
+    feed_watchdog()
+    record_recovery(subsystem, ok, health_failed_at.get(subsystem, now))
+    health_failures[subsystem] = 0
+    return ok
+
+def record_recovery(subsystem, ok, failed_at):
+    """Remember how long it took from the first failure to working again"""
+    took_ms = utime.ticks_diff(utime.ticks_ms(), failed_at)
+    result = "ok" if ok else "FAILED"
+    print(f"  {subsystem} recovery {result}, {took_ms} ms since first failure")
+    recovery_events.append(f"{get_formatted_time()} {subsystem} {result} ({took_ms} ms)")
+    if len(recovery_events) > 10:
+        recovery_events.pop(0)
+    log_recovery(f"{subsystem} recovery {result} in {took_ms} ms")
+
+def report_health(subsystem, ok):
+    """Called after every capture/write/accept; recovers after repeated failures"""
+    if ok:
+        health_failures[subsystem] = 0
+        return
+    count = health_failures.get(subsystem, 0) + 1
+    health_failures[subsystem] = count
+    if count == 1:
+        health_failed_at[subsystem] = utime.ticks_ms()
+    if count >= FAILURES_BEFORE_RECOVERY:
+        recover(subsystem)
+
+def check_wifi():
+    """Re-associate WiFi in the background without blocking captures"""
+    global wifi_reconnect_started, wifi_last_check
+    now = utime.ticks_ms()
+    if utime.ticks_diff(now, wifi_last_check) < WIFI_CHECK_INTERVAL_S * 1000:
+        return
+    wifi_last_check = now
+    sta_if = network.WLAN(network.STA_IF)
+    if sta_if.isconnected():
+        if wifi_reconnect_started is not None:
+            print(f"WiFi back, IP Address: {sta_if.ifconfig()[0]}")
+            record_recovery("wifi", True, wifi_reconnect_started)
+            wifi_reconnect_started = None
+            # The old listening socket is bound to the dead connection
+            recover("socket")
+        return
+
+    if wifi_reconnect_started is None:
+        print("WiFi lost, reconnecting...")
+        wifi_reconnect_started = now
+    elif utime.ticks_diff(now, wifi_reconnect_started) < WIFI_CONNECT_TIMEOUT_S * 1000:
+        return  # give the last connect() time to finish
+    else:
+        record_recovery("wifi", False, wifi_reconnect_started)
+        wifi_reconnect_started = now
+        recent = [t for t in recovery_history.get("wifi", [])
+                  if utime.ticks_diff(now, t) < RECOVERY_WINDOW_S * 1000]
+        if len(recent) >= MAX_SOFT_RECOVERIES:
+            full_reset(f"WiFi did not come back after {len(recent)} retries in {RECOVERY_WINDOW_S}s")
+        recent.append(now)
+        recovery_history["wifi"] = recent
+    try:
+        sta_if.disconnect()
+        sta_if.connect(SSID, PASSWORD)
+    except Exception as e:
+        print(f"WiFi connect error: {e}")
+# =============================
+
+# === RUNTIME CONFIG ===
+def load_config():
+    """Override settings from CONFIG_FILE on the SD card"""
+    try:
+        with open(CONFIG_FILE, "r") as f:
+            config = json.load(f)
+    except OSError:
+        print(f"  No {CONFIG_FILE}, using the settings in main.py")
+        return
+    except ValueError as e:
+        print(f"  Ignoring {CONFIG_FILE}: not valid JSON ({e})")
+        return
+    
+    settings = globals()
+    for key, value in config.items():
+        if key not in CONFIG_KEYS:
+            print(f"  Config: unknown setting {key}, ignored")
+            continue
+        current = settings[key]
+        if type(current) != type(value):
+            print(f"  Config: {key} should be {type(current).__name__}, ignored")
+            continue
+        low, high = CONFIG_RANGES.get(key, (None, None))
+        if (low is not None and value < low) or (high is not None and value > high):
+            print(f"  Config: {key} = {value} is out of range ({low} to {high or 'any'}), ignored")
+            continue
+        if value != current:
+            settings[key] = value
+            print(f"  Config: {key} = {value}")
+    
+    if "CAMERA_RESOLUTION" in config or "JPEG_QUALITY" in config:
+        try:
+            camera.framesize(CAMERA_RESOLUTION)
+            camera.quality(JPEG_QUALITY)
+        except Exception as e:
+            print(f"  Could not apply camera settings: {e}")
+# ======================
+
+def start_web_server():
+    global s, web_poller
+    web_close_all()
+    addr = socket.getaddrinfo('0.0.0.0', WEB_PORT)[0][-1]
+    s = socket.socket()
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind(addr)
+    s.listen(5)
+    s.setblocking(False)
+    web_poller = select.poll()
+    web_poller.register(s, select.POLLIN)
+    print(f'Web server started on http://{network.WLAN(network.STA_IF).ifconfig()[0]}')
+
+def loop_once():
+    """One pass of the main loop: each part gets a short slice of work"""
+    feed_watchdog()
+    check_shutter()
+    service_mqtt()
+    process_triggers()
+    try:
+        handle_web_requests()
+    except Exception as e:
+        print(f"Web server error: {e}")
+    
+    service_sse()
+    if background_allowed():
+        service_burst_extras()
+        service_uploads()
+        service_retention()
+    check_wifi()
+
+def setup():
+    """Everything main() does before the loop; resets the board if there is no SD card"""
+    global boot_ready_ms, last_shutter_state
     
     print("=" * 60)
     print(f"Starting {DEVICE_NAME}")
     print("=" * 60)
 
+    read_reset_info()
+    start_watchdog()
+
     connect_wifi()
     
     # Init camera after connecting wifi
@@ -829,21 +2508,26 @@ def main():
     if not mount_sd_card():
         print("CRITICAL: Halting due to SD card mounting failure.")
         print("Please check SD card seating and format (must be FAT32).")
-        return # Stop execution if we can't save files
+        # Nothing can be saved without it: reset and try again, with the
+        # reason kept in flash for the Diagnostics section
+        full_reset("SD mount failed")
+        return False
+
+    load_config()
 
     # Proceed with file system setup on the mounted card
     if not setup_filesystem():
         print("Filesystem setup had issues, but continuing...")
 
+    load_upload_queue()
+    refresh_free_space()
+
     last_shutter_state = shutter.value()
 
-    addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
-    s = socket.socket()
-    s.bind(addr)
-    s.listen(5)
-    s.setblocking(False)
-    s.settimeout(0.1)
-    print(f'Web server started on http://{network.WLAN(network.STA_IF).ifconfig()[0]}')
+    start_web_server()
+
+    boot_ready_ms = utime.ticks_diff(utime.ticks_ms(), boot_ticks)
+    log_recovery(f"boot: cause {reset_cause}, previous reason: {previous_reset_reason}, ready in {boot_ready_ms} ms")
 
     print("\n" + "=" * 60)
     print("System Ready!")
@@ -852,17 +2536,19 @@ def main():
     print("=" * 60)
     print("ALWAYS power off before removing SD card!")
     print("=" * 60)
+    return True
+
+def main():
+    """Main program function"""
+    if not setup():
+        return
 
     last_status_print = time.time()
     while True:
-        check_shutter()
-        try:
-            handle_web_requests()
-        except:
-            pass
+        loop_once()
         
         if time.time() - last_status_print > 30:
-            print(f"System running... Photos: {get_photo_count()}")
+            print(f"System running... Photos: {photo_total}")
             last_status_print = time.time()
         
         time.sleep(0.01)
@@ -877,5 +2563,4 @@ if __name__ == "__main__":
         print(f"Critical error: {e}")
         import sys
         sys.print_exception(e)
-        time.sleep(5)
-        machine.reset()
+        full_reset(f"unhandled error: {e}")
@@ -0,0 +1,82 @@
+import json
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+
+import fakeboard  # noqa: E402
+
+
+@pytest.fixture
+def virtual_board():
+    """Factory for quiet boards on the virtual clock with main.py loaded;
+    keyword arguments override main.py settings.
+    boot: True runs setup(), "sd" only mounts the card and sets up folders,
+    False leaves it to the test (e.g. to put files on the card first).
+    sd: an existing card, to boot again on it. config_file: written to
+    /sd/config.json before booting."""
+    boards = []
+
+    def make(boot=True, sd=None, sd_mb=32, config_file=None, **config):
+        board = fakeboard.Board(quiet=True, sd=sd, sd_mb=sd_mb)
+        if config_file is not None:
+            board.sd.add("/sd/config.json", json.dumps(config_file).encode())
+        board.load_main(**config)
+        boards.append(board)
+        if boot == "sd":
+            board.boot_filesystem()
+        elif boot:
+            board.boot()
+        return board
+
+    yield make
+    for board in boards:
+        board.shutdown()
+
+
+@pytest.fixture
+def real_board():
+    """Factory for booted boards on the real clock, for tests with real sockets.
+    Triggers are allowed close together so tests don't have to wait."""
+    boards = []
+
+    def make(**config):
+        board = fakeboard.Board(real_time=True, quiet=True)
+        board.camera.capture_ms = 20
+        board.camera.frames = [fakeboard.jpeg(60000)]
+        for name, value in (("TRIGGER_DEDUP_MS", 100), ("SHUTTER_DEBOUNCE_MS", 50),
+                            ("QUIET_GUARD_MS", 0)):
+            config.setdefault(name, value)
+        board.load_main(**config)
+        board.boot()
+        boards.append(board)
+        return board
+
+    yield make
+    for board in boards:
+        board.shutdown()
+
+
+@pytest.fixture
+def dead_port():
+    """A port where connect() hangs like an unreachable host: the listen
+    backlog is full and nobody accepts"""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(0)
+    port = server.getsockname()[1]
+    fill = []
+    for _ in range(3):
+        s = socket.socket()
+        s.setblocking(False)
+        s.connect_ex(("127.0.0.1", port))
+        fill.append(s)
+    time.sleep(0.1)
+    yield port
+    for s in fill:
+        s.close()
+    server.close()
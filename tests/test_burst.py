@@ -0,0 +1,95 @@
+"""Burst capture on synthetic frame sets (main.py BURST MODE), on the board clock"""
+
+import random
+
+from fakeboard import jpeg
+
+
+def frame_set(rng, count):
+    """One sharp frame among blurred and dark ones, in random order.
+    Returns the frames and the index of the sharp one."""
+    base = rng.randrange(40000, 90000)
+    frames = [jpeg(base)]
+    for _ in range(count - 1):
+        if rng.random() < 0.3:
+            frames.append(jpeg(int(base * rng.uniform(0.3, 0.6))))   # dark
+        else:
+            frames.append(jpeg(int(base * rng.uniform(0.7, 0.98))))  # motion blur
+    order = list(range(count))
+    rng.shuffle(order)
+    return [frames[i] for i in order], order.index(0)
+
+
+def test_sharpest_frame_is_kept(virtual_board):
+    board = virtual_board(BURST_FRAMES=4, BURST_BUDGET_MS=1000)
+    main = board.main
+    rng = random.Random(1)
+    for n in range(50):
+        frames, sharp = frame_set(rng, 4)
+        board.camera.frames = frames
+        board.camera.captures = 0
+        assert main.take_photo()
+        name = main.list_photos()[-1]
+        assert bytes(board.sd.files["/sd/photos/" + name]) == frames[sharp], f"set {n}"
+        board.clock.advance(3000)
+
+
+def test_burst_stops_at_the_budget(virtual_board):
+    board = virtual_board(BURST_FRAMES=5, BURST_BUDGET_MS=400)
+    main = board.main
+    # 120 ms per frame: a third one would end at 360 ms, a fourth past 400
+    assert len(main.capture_frames()) == 3
+    assert main.last_burst_ms == 360
+    # Layers 500 ms apart: half the gap is left for the burst
+    main.trigger_gaps_ms[:] = [500, 700]
+    assert len(main.capture_frames()) == 2
+
+
+def test_kept_frames_are_written_after_the_capture(virtual_board):
+    board = virtual_board(BURST_FRAMES=3, BURST_BUDGET_MS=1000, BURST_KEEP_ALL=True,
+                          QUIET_GUARD_MS=1500)
+    main = board.main
+    rng = random.Random(2)
+    frames, sharp = frame_set(rng, 3)
+    board.camera.frames = frames
+    board.sd.ops.clear()
+    assert main.take_photo()
+    # Only the chosen frame was written while the trigger waited
+    assert board.sd.ops["create"] == 1
+    assert len(main.burst_pending) == 2
+    assert "/sd/burst" not in board.sd.dirs
+
+    board.run(100)
+    kept = sorted(board.sd.listdir("/sd/burst"))
+    assert kept == ["photo_0000_b0.jpg", "photo_0000_b1.jpg"]
+    others = [f for i, f in enumerate(frames) if i != sharp]
+    assert [bytes(board.sd.files["/sd/burst/" + name]) for name in kept] == others
+
+
+def test_kept_frames_wait_for_the_quiet_window(virtual_board):
+    board = virtual_board(BURST_FRAMES=3, BURST_BUDGET_MS=1000, BURST_KEEP_ALL=True,
+                          QUIET_GUARD_MS=1500, BURST_PENDING_MAX=4, TRIGGER_DEDUP_MS=500)
+    main = board.main
+    board.camera.frames = [jpeg(50000), jpeg(60000), jpeg(40000)]
+    # Layers every 1.5 s: after the first one there is no quiet time left
+    for _ in range(6):
+        board.camera.captures = 0
+        board.run(1500 - board.press())
+    assert sorted(board.sd.listdir("/sd/burst")) == ["photo_0000_b0.jpg", "photo_0000_b1.jpg"]
+    # Only the newest four frames are held; older ones were dropped instead of
+    # holding up the next capture
+    assert [(num, k) for num, k, _ in main.burst_pending] == [(4, 0), (4, 1), (5, 0), (5, 1)]
+    # The print ends: they are written once the layers stop
+    board.run(5000)
+    assert not main.burst_pending
+    assert sorted(board.sd.listdir("/sd/burst"))[2:] == [
+        "photo_0004_b0.jpg", "photo_0004_b1.jpg", "photo_0005_b0.jpg", "photo_0005_b1.jpg"]
+
+
+def test_power_cut_while_saving_kept_frames(virtual_board):
+    board = virtual_board(boot=False)
+    board.sd.add("/sd/burst/photo_0003_b0.jpg.tmp", jpeg(40000))
+    board.sd.add("/sd/burst/photo_0003_b1.jpg.tmp", jpeg(40000)[:-100])
+    board.boot_filesystem()
+    # The complete one only missed its rename, the cut-off one is gone
+    assert sorted(board.sd.listdir("/sd/burst")) == ["photo_0003_b0.jpg"]
@@ -0,0 +1,113 @@
+"""Power cuts while a photo is being saved (main.py take_photo / recover_temp_files)
+
+The fake card can lose power during any write, rename, remove or sync; a write
+that is cut leaves only part of its data behind, like a real card.
+"""
+
+import time
+
+import fakeboard
+from fakeboard import PowerCut, jpeg
+
+FRAME = jpeg(30000)
+
+
+def card_with_two_photos(virtual_board, sd=None):
+    """A board with two photos saved, or booted again on an existing card"""
+    board = virtual_board(boot="sd", sd=sd)
+    board.camera.frames = [FRAME]
+    if sd is None:
+        assert board.main.take_photo() and board.main.take_photo()
+    return board, board.main
+
+
+def steps_per_photo(virtual_board):
+    board, main = card_with_two_photos(virtual_board)
+    before = board.sd.mutations()
+    assert main.take_photo()
+    return board.sd.mutations() - before
+
+
+def test_power_cut_at_every_step(virtual_board):
+    steps = steps_per_photo(virtual_board)
+    assert steps >= 4  # create, write, rename, sync at least
+    for step in range(1, steps + 1):
+        board, main = card_with_two_photos(virtual_board)
+        board.sd.cut_power_at(step)
+        try:
+            main.take_photo()
+        except PowerCut:
+            pass
+        assert board.sd.dead, f"step {step} was never reached"
+
+        board.sd.power_on()
+        board, main = card_with_two_photos(virtual_board, sd=board.sd)
+        names = board.sd.listdir("/sd/photos")
+        assert not [n for n in names if n.endswith(".tmp")], f"step {step}: {names}"
+        photos = main.list_photos()
+        # The third photo is either all there or not there at all
+        assert len(photos) in (2, 3), f"step {step}: {photos}"
+        for name in photos:
+            assert bytes(board.sd.files["/sd/photos/" + name]) == FRAME, f"step {step}: {name}"
+        assert main.picture_count == len(photos)
+
+        # Numbering carries on without overwriting anything
+        assert main.take_photo()
+        assert len(main.list_photos()) == len(photos) + 1
+        assert main.list_photos()[-1].startswith(f"photo_{len(photos):04d}_")
+
+
+def test_unknown_temp_files_are_left_alone(virtual_board):
+    board = virtual_board(boot=False)
+    board.sd.add("/sd/photos/garbage.jpg.tmp", jpeg(1000))
+    board.sd.add("/sd/photos/photo_12ab_x.jpg.tmp", jpeg(1000))
+    board.sd.add("/sd/photos/photo_0003_2026-01-01_00-00-00.jpg.tmp", jpeg(1000))
+    main = board.main
+    board.boot_filesystem()
+    names = board.sd.listdir("/sd/photos")
+    assert "garbage.jpg.tmp" in names and "photo_12ab_x.jpg.tmp" in names
+    assert "garbage.jpg" not in names
+    # Our own finished temp file is recovered as usual
+    assert main.list_photos() == ["photo_0003_2026-01-01_00-00-00.jpg"]
+    assert main.picture_count == 4
+
+
+def commit_direct(sd, path, buf):
+    """How take_photo saved before: write in place, sync, stat to check the size"""
+    with sd.open(path, "wb") as f:
+        f.write(buf)
+    sd.sync()
+    return sd.stat(path)[6] == len(buf)
+
+
+def commit_atomic(sd, path, buf):
+    """How take_photo saves now: write a temp file, rename it, sync"""
+    with sd.open(path + ".tmp", "wb") as f:
+        written = f.write(buf)
+    if written != len(buf):
+        return False
+    sd.rename(path + ".tmp", path)
+    sd.sync()
+    return True
+
+
+def test_commit_cost():
+    frames = 200
+    results = {}
+    for commit in (commit_direct, commit_atomic):
+        sd = fakeboard.FakeSD()
+        sd.mkdir("/sd/photos")
+        sd.ops.clear()
+        start = time.perf_counter()
+        for n in range(frames):
+            assert commit(sd, f"/sd/photos/photo_{n:04d}_x.jpg", FRAME)
+        elapsed = (time.perf_counter() - start) / frames * 1e6
+        results[commit.__name__] = ({k: v / frames for k, v in sorted(sd.ops.items())}, elapsed)
+
+    print()
+    for name, (ops, us) in results.items():
+        print(f"{name}: {sum(ops.values()):.0f} fs ops/frame {ops}, {us:.0f} us/frame on the fake card")
+    direct, atomic = results["commit_direct"][0], results["commit_atomic"][0]
+    # The rename replaces the stat: same number of filesystem operations per frame
+    assert sum(atomic.values()) == sum(direct.values())
+    assert "stat" not in atomic
@@ -0,0 +1,167 @@
+"""Layer-change triggers from a local stand-in for the printer's MQTT broker
+(main.py MQTT LAYER TRIGGER). Plain MQTT on localhost, real clock except where noted."""
+
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+
+def read_packet(sock):
+    header = sock.recv(1)[0]
+    length, shift = 0, 0
+    while True:
+        byte = sock.recv(1)[0]
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    body = b""
+    while len(body) < length:
+        body += sock.recv(length - len(body))
+    return header, body
+
+
+def packet(header, body):
+    out = bytearray([header])
+    n = len(body)
+    while True:
+        out.append((n & 0x7F) | (0x80 if n > 0x7F else 0))
+        n >>= 7
+        if not n:
+            break
+    return bytes(out) + body
+
+
+def mqtt_str(data):
+    return len(data).to_bytes(2, "big") + data
+
+
+class Broker:
+    """Accepts one client, answers CONNECT and SUBSCRIBE, then publishes on request"""
+
+    def __init__(self, answer=True):
+        self.answer = answer
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.client = None
+        self.connect_body = None
+        self.topic = None
+        self.subscribed = threading.Event()
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        self.client, _ = self.server.accept()
+        header, self.connect_body = read_packet(self.client)
+        assert header == 0x10
+        if not self.answer:
+            return
+        self.client.sendall(b"\x20\x02\x00\x00")  # CONNACK, accepted
+        header, body = read_packet(self.client)
+        assert header == 0x82
+        self.topic = body[4:4 + int.from_bytes(body[2:4], "big")].decode()
+        self.client.sendall(b"\x90\x03" + body[:2] + b"\x00")  # SUBACK
+        self.subscribed.set()
+
+    def publish(self, layer):
+        payload = json.dumps({"print": {"layer_num": layer, "mc_percent": 12}}).encode()
+        self.client.sendall(packet(0x30, mqtt_str(self.topic.encode()) + payload))
+
+    def close(self):
+        if self.client:
+            self.client.close()
+        self.server.close()
+
+
+@pytest.fixture
+def broker():
+    brokers = []
+
+    def make(answer=True):
+        brokers.append(Broker(answer))
+        return brokers[-1]
+
+    yield make
+    for b in brokers:
+        b.close()
+
+
+def printer_config(port, **config):
+    return dict(PRINTER_IP="127.0.0.1", MQTT_PORT=port, MQTT_TLS=False,
+                PRINTER_SERIAL="01S00TEST", PRINTER_ACCESS_CODE="12345678", **config)
+
+
+def test_layer_change_to_frame_latency(real_board, broker):
+    b = broker()
+    board = real_board(**printer_config(b.port))
+    main = board.main
+    board.run(2000, until=lambda: main.mqtt_state == "up")
+    assert main.mqtt_state == "up"
+    assert b.subscribed.wait(1)
+    assert b.topic == "device/01S00TEST/report"
+    assert b"bblp" in b.connect_body and b"12345678" in b.connect_body
+
+    b.publish(1)  # first report only sets the starting layer
+    board.run(100)
+    assert main.picture_count == 0
+
+    latencies = []
+    for layer in range(2, 12):
+        before = main.picture_count
+        start = time.perf_counter()
+        b.publish(layer)
+        board.run(2000, until=lambda: main.picture_count > before)
+        assert main.picture_count == before + 1, f"layer {layer} gave no photo"
+        latencies.append((time.perf_counter() - start) * 1000)
+        board.run(150)  # past TRIGGER_DEDUP_MS
+    # The switch still works alongside
+    press_ms = board.press()
+    latencies.sort()
+    print(f"\nMQTT message to saved frame: median {latencies[5]:.0f} ms, "
+          f"max {latencies[-1]:.0f} ms; switch press meanwhile {press_ms} ms")
+    assert latencies[-1] < 300
+
+
+@pytest.mark.parametrize("printer", ["unreachable", "silent"])
+def test_printer_problems_do_not_block_the_shutter(real_board, broker, dead_port, printer):
+    port = dead_port if printer == "unreachable" else broker(answer=False).port
+    board = real_board(**printer_config(port, MQTT_CONNECT_TIMEOUT_S=1))
+    main = board.main
+    latencies = []
+    longest = 0
+    for _ in range(8):
+        latencies.append(board.press())
+        longest = max(longest, board.run(200))
+    # The connect attempt timed out and a retry is scheduled
+    assert main.mqtt_sock is None and main.mqtt_backoff >= 5
+    print(f"\n{printer} printer: shutter to saved max {max(latencies)} ms, "
+          f"longest loop pass {longest:.1f} ms")
+    assert max(latencies) < 300
+    assert longest < 50
+
+
+def test_reconnect_waits_for_the_quiet_window(virtual_board, dead_port):
+    # Board clock: the quiet window is set up by hand
+    board = virtual_board(QUIET_GUARD_MS=1500, **printer_config(dead_port, MQTT_CONNECT_TIMEOUT_S=1))
+    main = board.main
+    clock = board.clock
+    # Layers every 10 s, the last one 9 s ago: the next is due within the guard
+    main.trigger_gaps_ms[:] = [10000, 10000]
+    main.last_trigger_ms = clock.ticks_add(clock.ticks_ms(), -9000)
+    main.service_mqtt()
+    assert main.mqtt_sock is None
+
+    # The layer arrives: connecting starts, then waits out the next guard
+    main.last_trigger_ms = clock.ticks_ms()
+    main.service_mqtt()
+    assert main.mqtt_state == "connecting"
+    clock.advance(9000)
+    main.service_mqtt()
+    assert main.mqtt_state == "connecting"  # past its deadline, but not looked at
+    main.last_trigger_ms = clock.ticks_ms()
+    main.service_mqtt()
+    assert main.mqtt_sock is None and main.mqtt_backoff == 5
@@ -0,0 +1,121 @@
+"""Injected faults and how long until the camera takes photos again
+(main.py WATCHDOG AND RECOVERY), on the board clock."""
+
+import errno
+
+import pytest
+
+from fakeboard import BoardReset
+
+
+def time_to_capture_ready(board, every_ms=2500, limit_ms=60000):
+    """Press the shutter every every_ms from now until a photo is saved.
+    Returns board ms from now to that photo."""
+    main = board.main
+    start = board.clock.ticks_ms()
+    before = main.picture_count
+    while main.picture_count == before:
+        assert board.clock.ticks_ms() - start < limit_ms, "never became ready"
+        board.shutter = 0
+        board.run(30)
+        board.shutter = 1
+        board.run(every_ms - 30, until=lambda: main.picture_count > before)
+    return board.clock.ticks_ms() - start
+
+
+def report(fault, ms, main):
+    print(f"\n{fault}: ready to capture after {ms} ms; {main.recovery_events[-1:]}")
+
+
+def test_camera_stops_answering(virtual_board):
+    board = virtual_board()
+    board.run(3000)
+    board.camera.fail = True  # stays broken until the camera is re-initialised
+    ms = time_to_capture_ready(board)
+    report("camera", ms, board.main)
+    # FAILURES_BEFORE_RECOVERY failed presses, then the reinit; the next press works
+    assert ms < (board.main.FAILURES_BEFORE_RECOVERY + 1) * 2500
+    assert "camera ok" in board.main.recovery_events[-1]
+
+
+def test_sd_card_write_errors(virtual_board):
+    board = virtual_board()
+    board.run(3000)
+    board.sd.broken = True  # EIO until the card is mounted again
+    ms = time_to_capture_ready(board)
+    report("sd", ms, board.main)
+    assert ms < (board.main.FAILURES_BEFORE_RECOVERY + 1) * 2500
+    assert "sd ok" in board.main.recovery_events[-1]
+    assert board.main.list_photos()
+
+
+def test_wifi_drop_does_not_stop_captures(virtual_board):
+    board = virtual_board()
+    main = board.main
+    board.run(3000)
+    old_socket = main.s
+    board.wifi_up = False
+    # The switch keeps working while WiFi is gone
+    for _ in range(4):
+        assert time_to_capture_ready(board) <= 500
+        board.run(5000)
+    board.wifi_up = True
+    start = board.clock.ticks_ms()
+    board.run(30000, until=lambda: main.wifi_reconnect_started is None)
+    web_ms = board.clock.ticks_ms() - start
+    print(f"\nwifi: web server back {web_ms} ms after the network returned; "
+          f"{main.recovery_events[-1:]}")
+    assert main.wifi_reconnect_started is None
+    assert main.s is not old_socket  # listening socket recreated on the new connection
+    assert web_ms <= main.WIFI_CHECK_INTERVAL_S * 1000
+    assert time_to_capture_ready(board) <= 500
+
+
+def test_web_server_failing_to_restart_after_wifi_returns(virtual_board, monkeypatch):
+    board = virtual_board()
+    main = board.main
+    board.run(3000)
+    board.wifi_up = False
+    board.run(main.WIFI_CHECK_INTERVAL_S * 1000 + 1000)
+
+    def no_server():
+        raise OSError(errno.EADDRINUSE)
+    monkeypatch.setattr(main, "start_web_server", no_server)
+    board.wifi_up = True
+    board.run(30000, until=lambda: main.wifi_reconnect_started is None)
+    assert main.wifi_reconnect_started is None
+    # A soft recovery that failed, not a reset; the switch still works
+    assert "socket FAILED" in main.recovery_events[-1]
+    assert time_to_capture_ready(board) <= 500
+
+
+def test_sd_mount_failure_resets_with_a_reason(virtual_board):
+    board = virtual_board(boot=False)
+    board.sd_mount_ok = False
+    with pytest.raises(BoardReset):
+        board.boot()
+    # The reason is kept in flash, the card is not needed for it
+    assert bytes(board.sd.files["/reset_reason.txt"]).startswith(b"SD mount failed")
+
+    # Card seated again: the next boot shows why it reset and is ready at once
+    board = virtual_board(sd=board.sd)
+    main = board.main
+    assert main.previous_reset_reason.startswith("SD mount failed")
+    ms = time_to_capture_ready(board)
+    print(f"\nSD mount failure: first photo {ms} ms after the next boot")
+    assert ms <= 500
+
+
+def test_repeated_failures_end_in_a_full_reset(virtual_board):
+    board = virtual_board(MAX_SOFT_RECOVERIES=2)
+    main = board.main
+    with pytest.raises(BoardReset):
+        for _ in range(10):
+            board.camera.fail = True
+            board.shutter = 0
+            board.run(30)
+            board.shutter = 1
+            board.run(2500)
+    reason = bytes(board.sd.files["/reset_reason.txt"]).decode()
+    assert reason.startswith("camera failed 2 recoveries")
+    assert len(main.recovery_events) == 2
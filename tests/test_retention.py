@@ -0,0 +1,88 @@
+"""Free space tracking and retention on a fake card (main.py SD SPACE AND RETENTION)"""
+
+from fakeboard import jpeg
+
+
+def run_background(main, passes=200):
+    for _ in range(passes):
+        main.service_retention()
+
+
+def test_limits_off_by_default_never_delete(virtual_board):
+    board = virtual_board(boot="sd", sd_mb=3)
+    main = board.main
+    board.camera.frames = [jpeg(60000)]
+    saved = 0
+    for _ in range(60):
+        saved += bool(main.take_photo())
+        run_background(main, 5)
+    # The card fills up and captures fail, but nothing the user took is deleted
+    assert 0 < saved < 60
+    assert len(main.list_photos()) == saved
+
+
+def test_floor_does_not_empty_a_small_card(virtual_board):
+    board = virtual_board(boot=False, sd_mb=10, RETAIN_MIN_FREE_MB=50)
+    main = board.main
+    for n in range(100):
+        board.sd.add(f"/sd/photos/photo_{n:04d}_2026-01-01_00-00-{n % 60:02d}.jpg", jpeg(60000))
+    board.boot_filesystem()
+    assert main.take_photo()
+    run_background(main)
+    # 101 photos in 64 KB clusters leave ~3.5 MB free, over a tenth of the card
+    assert len(main.list_photos()) == 101
+
+
+def test_nothing_is_deleted_before_the_first_photo(virtual_board):
+    board = virtual_board(boot=False, sd_mb=10, RETAIN_MIN_FREE_MB=50)
+    main = board.main
+    for n in range(140):
+        board.sd.add(f"/sd/photos/photo_{n:04d}_2026-01-01_00-00-{n % 60:02d}.jpg", jpeg(60000))
+    board.boot_filesystem()
+    run_background(main)
+    board.clock.advance(main.FREE_SPACE_REFRESH_S * 1000 + 1000)
+    run_background(main)
+    # Under the floor, but the camera has only been switched on
+    assert len(main.list_photos()) == 140
+    assert main.take_photo()
+    run_background(main)
+    assert len(main.list_photos()) < 140
+
+
+def test_floor_is_kept_while_capturing(virtual_board):
+    board = virtual_board(boot="sd", sd_mb=10, RETAIN_MIN_FREE_MB=50, RETENTION_HEADROOM_FRAMES=2)
+    main = board.main
+    board.camera.frames = [jpeg(60000)]
+    for _ in range(300):
+        assert main.take_photo()
+        run_background(main, 5)
+    main.refresh_free_space()
+    assert main.free_bytes >= main.min_free_bytes()
+    assert len(main.list_photos()) < 300
+
+
+def test_power_cycle_between_prints_starts_a_new_session(virtual_board):
+    board = virtual_board(boot=False, RETAIN_MIN_FREE_MB=0, RETAIN_MAX_SESSIONS=1)
+    main = board.main
+    # No NTP: after each power-up the clock starts again at 2000-01-01 00:00
+    for n in range(40):
+        board.sd.add(f"/sd/photos/photo_{n:04d}_2000-01-01_00-{n % 20:02d}-00.jpg", jpeg(30000))
+    board.boot_filesystem()
+    main.plan_retention()
+    assert main.retention_queue == main.list_photos()[:20]
+
+
+def test_evicted_photos_take_their_burst_frames_along(virtual_board):
+    board = virtual_board(boot=False, RETAIN_MAX_FRAMES=2, BURST_FRAMES=2)
+    for n in range(3):
+        board.sd.add(f"/sd/photos/photo_{n:04d}_2026-01-01_00-00-0{n}.jpg", jpeg(30000))
+    # Kept while BURST_FRAMES was 5
+    for k in range(4):
+        board.sd.add(f"/sd/burst/photo_0000_b{k}.jpg", jpeg(20000))
+    board.sd.add("/sd/burst/photo_0001_b0.jpg", jpeg(20000))
+    board.boot_filesystem()
+    main = board.main
+    main.plan_retention()
+    run_background(main)
+    assert len(main.list_photos()) == 2
+    assert board.sd.listdir("/sd/burst") == ["photo_0001_b0.jpg"]
@@ -0,0 +1,118 @@
+"""Scripted trigger timelines against the capture schedule (main.py TRIGGER QUEUE)
+and config.json checking, on the board clock."""
+
+import pytest
+
+
+def run_timeline(board, events, end_s):
+    """Play (seconds, source) triggers into a booted board until end_s.
+    "switch" presses the shutter for 30 ms, other sources are queued like the
+    MQTT and web handlers do. Returns (seconds, source) for each photo saved."""
+    main = board.main
+    start = board.clock.ticks_ms()
+    events = sorted(events)
+    photos = []
+    release_ms = None
+    while board.clock.ticks_ms() - start <= end_s * 1000:
+        now = board.clock.ticks_ms() - start
+        while events and events[0][0] * 1000 <= now:
+            source = events.pop(0)[1]
+            if source == "switch":
+                board.shutter = 0
+                release_ms = now + 30
+            else:
+                main.queue_trigger(source)
+        if release_ms is not None and now >= release_ms:
+            board.shutter = 1
+            release_ms = None
+        before = main.picture_count
+        main.loop_once()
+        if main.picture_count > before:
+            photos.append((round((board.clock.ticks_ms() - start) / 1000, 1), main.last_trigger_source))
+        board.clock.advance(10)
+    return photos
+
+
+def every(step_s, count, source="switch", first_s=0):
+    return [(first_s + n * step_s, source) for n in range(count)]
+
+
+def test_every_nth_layer(virtual_board):
+    board = virtual_board(config_file={"CAPTURE_EVERY_NTH": 3})
+    photos = run_timeline(board, every(5, 9) + [(12, "web")], 45)
+    # Presses 3, 6 and 9; the dashboard button is never skipped
+    assert photos == [(10.1, "switch"), (12.1, "web"), (25.1, "switch"), (40.1, "switch")]
+
+
+def test_web_press_is_not_merged_into_a_skipped_trigger(virtual_board):
+    board = virtual_board(config_file={"CAPTURE_EVERY_NTH": 3})
+    photos = run_timeline(board, [(5, "switch"), (6, "web")], 8)
+    assert photos == [(6.1, "web")]
+    # A manual press says nothing about how fast layers come
+    assert board.main.trigger_gaps_ms == []
+
+
+def test_web_press_right_after_a_photo_is_taken(virtual_board):
+    board = virtual_board(config_file={"CAPTURE_MIN_INTERVAL_S": 30})
+    photos = run_timeline(board, [(10, "switch"), (11, "web")], 13)
+    assert photos == [(10.1, "switch"), (11.1, "web")]
+
+
+def test_minimum_interval(virtual_board):
+    board = virtual_board(config_file={"CAPTURE_MIN_INTERVAL_S": 12})
+    photos = run_timeline(board, every(5, 9), 45)
+    assert [t for t, _ in photos] == [0.1, 15.1, 30.1]
+
+
+def test_fallback_interval_when_triggers_stop(virtual_board):
+    board = virtual_board(config_file={"CAPTURE_FALLBACK_S": 10})
+    photos = run_timeline(board, every(5, 2), 40)
+    assert [source for _, source in photos] == ["switch", "switch", "interval", "interval", "interval"]
+    # Each interval photo comes CAPTURE_FALLBACK_S after the last trigger
+    times = [t for t, _ in photos]
+    assert times[2] == pytest.approx(15.1, abs=0.1)
+    assert times[3] - times[2] == pytest.approx(10, abs=0.1)
+
+
+def test_switch_and_mqtt_for_the_same_layer_give_one_photo(virtual_board):
+    board = virtual_board(config_file={})
+    events = [(0, "switch"), (0.3, "mqtt"), (20, "mqtt"), (20.5, "switch"), (40, "mqtt")]
+    photos = run_timeline(board, events, 45)
+    assert [source for _, source in photos] == ["switch", "mqtt", "mqtt"]
+
+
+def test_background_work_waits_for_the_quiet_window(virtual_board):
+    board = virtual_board(config_file={"QUIET_GUARD_MS": 1500})
+    main = board.main
+    run_timeline(board, every(10, 4), 30.5)
+    # Layers every 10 s, last at 30 s: the next one is due at 40 s
+    allowed = {}
+    start = main.last_trigger_ms
+    for at_s in (1, 5, 8, 8.6, 9.5):
+        board.clock.advance(start + int(at_s * 1000) - board.clock.ticks_ms())
+        allowed[at_s] = main.background_allowed()
+    assert allowed == {1: True, 5: True, 8: True, 8.6: False, 9.5: False}
+
+
+BAD_VALUES = {
+    "SSE_MAX_CLIENTS": 0, "RETENTION_BATCH": 0, "UPLOAD_CHUNK_SIZE": 0,
+    "CAPTURE_EVERY_NTH": 0, "MQTT_KEEPALIVE_S": 1, "JPEG_QUALITY": 99, "MQTT_PORT": 70000,
+}
+
+
+def test_out_of_range_config_is_ignored(virtual_board):
+    defaults = virtual_board(boot=False).main
+    board = virtual_board(config_file=dict(BAD_VALUES, BURST_FRAMES=3, SESSION_GAP_S="60"))
+    main = board.main
+    for key in BAD_VALUES:
+        assert getattr(main, key) == getattr(defaults, key), key
+    assert main.BURST_FRAMES == 3
+    assert main.SESSION_GAP_S == defaults.SESSION_GAP_S
+    # Still takes photos: three 120 ms frames for the burst
+    assert run_timeline(board, [(0, "switch")], 1) == [(0.4, "switch")]
+
+
+def test_every_number_setting_has_a_range(virtual_board):
+    main = virtual_board(boot=False).main
+    numbers = [k for k in main.CONFIG_KEYS if type(getattr(main, k)) in (int, float)]
+    assert sorted(numbers) == sorted(main.CONFIG_RANGES)
@@ -0,0 +1,121 @@
+"""Live updates to several dashboards at once (main.py LIVE UPDATES (SSE)),
+on real localhost sockets and the real clock."""
+
+import json
+import socket
+import statistics
+
+from fakeboard import read_some
+
+
+class Dashboard:
+    """A browser with /events open, collecting the events it is sent"""
+
+    def __init__(self, board, rcvbuf=None):
+        self.sock = socket.socket()
+        if rcvbuf:
+            # A tiny window, so the server notices quickly when we stop reading
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.sock.connect(("127.0.0.1", board.web_port))
+        self.sock.sendall(b"GET /events HTTP/1.1\r\nHost: camera\r\n\r\n")
+        self.sock.setblocking(False)
+        self.data = bytearray()
+        self.closed = False
+
+    def read(self):
+        if not self.closed:
+            self.closed = read_some(self.sock, self.data)
+        return False
+
+    def events(self, kind=None):
+        body = bytes(self.data).split(b"\r\n\r\n", 1)[-1].decode()
+        out = []
+        for block in body.split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.split("\n") if ": " in line)
+            if "event" in fields and (kind is None or fields["event"] == kind):
+                out.append((fields["event"], json.loads(fields["data"])))
+        return out
+
+    def close(self):
+        self.sock.close()
+
+
+def read_all(dashboards):
+    for d in dashboards:
+        d.read()
+    return False
+
+
+def test_fan_out_and_shutter_latency(real_board):
+    board = real_board()
+    main = board.main
+    quiet = []
+    for _ in range(8):
+        quiet.append(board.press())
+        board.run(150)
+
+    dashboards = [Dashboard(board) for _ in range(main.SSE_MAX_CLIENTS)]
+    board.run(1000, until=lambda: read_all(dashboards) or all(d.events("hello") for d in dashboards))
+    assert all(d.events("hello") == [("hello", {"next": 8})] for d in dashboards)
+
+    loaded = []
+    for _ in range(8):
+        loaded.append(board.press(also=lambda: read_all(dashboards)))
+        # Each dashboard has the frame by the time the photo is saved
+        board.run(50, until=lambda: read_all(dashboards))
+        assert all(len(d.events("frame")) == len(loaded) for d in dashboards)
+        board.run(100, until=lambda: read_all(dashboards))
+
+    for d in dashboards:
+        frames = [data["num"] for _, data in d.events("frame")]
+        assert frames == list(range(8, 16))
+        assert not d.closed
+        d.close()
+    print(f"\nshutter to saved: median {statistics.median(quiet)} ms with no dashboard, "
+          f"{statistics.median(loaded)} ms with {len(dashboards)} (max {max(loaded)} ms)")
+    assert statistics.median(loaded) <= statistics.median(quiet) + 10
+    assert max(loaded) < 300
+
+
+def test_newest_dashboard_wins(real_board):
+    board = real_board()
+    main = board.main
+    dashboards = [Dashboard(board) for _ in range(main.SSE_MAX_CLIENTS + 1)]
+    board.run(1000, until=lambda: read_all(dashboards) or dashboards[0].closed)
+    assert dashboards[0].closed
+    assert len(main.sse_clients) == main.SSE_MAX_CLIENTS
+    board.press(also=lambda: read_all(dashboards))
+    board.run(50, until=lambda: read_all(dashboards))
+    assert not dashboards[0].events("frame")
+    assert all(len(d.events("frame")) == 1 for d in dashboards[1:])
+    for d in dashboards:
+        d.close()
+
+
+def test_stalled_dashboard_is_dropped(real_board):
+    board = real_board()
+    main = board.main
+    reader = Dashboard(board)
+    stalled = Dashboard(board, rcvbuf=1024)
+    board.run(1000, until=lambda: len(main.sse_clients) == 2)
+    assert len(main.sse_clients) == 2
+    # Small send buffers on our side too, so a backlog reaches SSE_MAX_BUFFER quickly
+    for client in main.sse_clients:
+        client[0].setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+
+    # Sync progress floods in; the stalled dashboard never reads a byte
+    sent = 0
+    longest = 0
+    while len(main.sse_clients) == 2 and sent < 2000:
+        main.send_event("sync", {"step": sent, "pad": "x" * 100})
+        sent += 1
+        longest = max(longest, board.run(10, until=reader.read))
+    board.run(500, until=reader.read)
+    print(f"\nstalled dashboard dropped after {sent} events; longest loop pass {longest:.2f} ms")
+    assert len(main.sse_clients) == 1
+    assert [data["step"] for _, data in reader.events("sync")] == list(range(sent))
+    assert not reader.closed
+    # The shutter doesn't care
+    assert board.press(also=reader.read) < 300
+    reader.close()
+    stalled.close()
@@ -0,0 +1,76 @@
+"""Background uploads against tools/receiver.py on localhost (main.py BACKGROUND UPLOADER)
+
+Runs on the real clock: the sockets are real, so timeouts are too.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+import receiver
+
+
+@pytest.fixture
+def receiver_url(tmp_path):
+    receiver.UploadHandler.out_dir = str(tmp_path)
+    receiver.Stats.frames = receiver.Stats.bytes = 0
+    receiver.Stats.started = None
+    server = receiver.ThreadingHTTPServer(("127.0.0.1", 0), receiver.UploadHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/upload"
+    server.shutdown()
+    server.server_close()
+
+
+def uploads_done(main):
+    return not main.upload_pending and main.upload_job is None
+
+
+def test_uploads_and_shutter_latency(real_board, receiver_url, tmp_path):
+    board = real_board(UPLOAD_URL=receiver_url)
+    main = board.main
+    latencies = []
+    longest = 0
+    for _ in range(10):
+        latencies.append(board.press())
+        longest = max(longest, board.run(100))
+    board.run(10000, until=lambda: uploads_done(main))
+    assert main.upload_sent == 10
+
+    # Throughput with a backlog: 20 photos waiting, then only the loop runs
+    for _ in range(20):
+        assert main.take_photo()
+    start = time.perf_counter()
+    longest = max(longest, board.run(30000, until=lambda: uploads_done(main)))
+    rate = 20 / (time.perf_counter() - start)
+
+    assert main.upload_sent == 30
+    received = sorted(os.listdir(tmp_path))
+    assert received == main.list_photos()
+    assert all(os.path.getsize(tmp_path / name) == 60000 for name in received)
+    latencies.sort()
+    print(f"\nuploads: {rate:.1f} frames/s of 60 KB, shutter to saved while uploading: "
+          f"median {latencies[5]} ms, max {latencies[-1]} ms, "
+          f"longest loop pass {longest:.1f} ms")
+    assert latencies[-1] < 300
+    assert longest < 50
+
+
+def test_offline_pc_does_not_block_the_shutter(real_board, dead_port):
+    board = real_board(UPLOAD_URL=f"http://127.0.0.1:{dead_port}/upload", UPLOAD_TIMEOUT_S=1)
+    main = board.main
+    latencies = [board.press()]
+    # The upload is now stuck connecting; every press must still be seen at once
+    longest = 0
+    for _ in range(8):
+        longest = max(longest, board.run(200))
+        latencies.append(board.press())
+    assert main.upload_failed_count >= 1
+    assert main.upload_sent == 0
+    assert len(main.upload_pending) == 9
+    print(f"\noffline PC: shutter to saved max {max(latencies)} ms, "
+          f"longest loop pass {longest:.1f} ms, {main.upload_failed_count} failed connects")
+    assert max(latencies) < 300
+    assert longest < 50
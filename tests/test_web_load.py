@@ -0,0 +1,125 @@
+"""Many slow web clients against main.py's web server (main.py WEB SERVER),
+on real localhost sockets and the real clock."""
+
+import statistics
+import time
+
+from fakeboard import read_some
+
+
+class SlowClients:
+    """n clients that connect and never finish their request; every other one
+    trickles a byte now and then. Closed ones are replaced straight away, so
+    the server never gets a free moment."""
+
+    def __init__(self, board, n):
+        self.board = board
+        self.n = n
+        self.socks = []
+        self.dropped = 0
+        self.trickled_at = 0
+        self.tick()
+
+    def tick(self):
+        for sock in self.socks[:]:
+            if read_some(sock, bytearray()):
+                sock.close()
+                self.socks.remove(sock)
+                self.dropped += 1
+        while len(self.socks) < self.n:
+            self.socks.append(self.board.web_client())
+        now = time.monotonic()
+        if now - self.trickled_at > 0.1:
+            self.trickled_at = now
+            for sock in self.socks[::2]:
+                try:
+                    sock.send(b"x")
+                except OSError:
+                    pass
+        return False
+
+    def close(self):
+        for sock in self.socks:
+            sock.close()
+
+
+def test_idle_clients_are_dropped_after_the_header_timeout(real_board):
+    board = real_board()
+    main = board.main
+    clients = [board.web_client() for _ in range(6)]
+    start = time.monotonic()
+    closed_after = {}
+
+    def check():
+        for i, sock in enumerate(clients):
+            if i not in closed_after and read_some(sock, bytearray()):
+                closed_after[i] = (time.monotonic() - start) * 1000
+        return len(closed_after) == len(clients)
+
+    board.run(6000, until=check)
+    print(f"\nidle clients closed after {min(closed_after.values()):.0f}"
+          f"-{max(closed_after.values()):.0f} ms")
+    assert len(closed_after) == 6
+    timeout = main.WEB_HEADER_TIMEOUT_MS
+    assert all(timeout <= ms < timeout + 500 for ms in closed_after.values())
+    assert not main.web_conns
+    for sock in clients:
+        sock.close()
+
+
+def test_busy_server_sheds_with_503(real_board):
+    board = real_board()
+    main = board.main
+    limit = main.WEB_MAX_CONNECTIONS
+    idle = [board.web_client() for _ in range(limit)]
+    board.run(100)
+    assert len(main.web_conns) == limit
+
+    # Every slot is held by an idle client: a real request gets a quick 503
+    reply = board.web_get("/", wait_ms=1000)
+    assert reply.startswith(b"HTTP/1.1 503") and b"Retry-After: 2" in reply
+
+    # Past twice the limit, new connections are closed without a reply
+    extra = [board.web_client() for _ in range(limit + 2)]
+    replies = [bytearray() for _ in extra]
+    board.run(500, until=lambda: all(read_some(s, r) for s, r in zip(extra, replies)))
+    assert len(main.web_conns) == 2 * limit
+    assert sum(1 for r in replies if not r) >= 2
+
+    # Once the idle ones time out the page is served again
+    board.run(main.WEB_HEADER_TIMEOUT_MS + 200)
+    assert board.web_get("/").startswith(b"HTTP/1.1 200 OK")
+    for sock in idle + extra:
+        sock.close()
+
+
+def test_slow_client_storm_keeps_the_loop_fast(real_board):
+    board = real_board()
+    main = board.main
+    quiet = []
+    for _ in range(10):
+        quiet.append(board.press())
+        board.run(150)
+
+    storm = SlowClients(board, 30)
+    loaded = []
+    board.pass_ms.clear()
+    for _ in range(10):
+        loaded.append(board.press(also=storm.tick))
+        board.run(150, until=storm.tick)
+    # Long enough for the idle ones to time out and be replaced
+    board.run(4000, until=storm.tick)
+    # Capture passes take the camera's time; the rest is the server's doing
+    passes = sorted(ms for ms in board.pass_ms if ms < board.camera.capture_ms)
+    storm.close()
+
+    p99 = passes[len(passes) * 99 // 100]
+    print(f"\nshutter to saved: median {statistics.median(quiet)} ms idle, "
+          f"{statistics.median(loaded)} ms with 30 slow clients (max {max(loaded)} ms); "
+          f"{len(passes)} loop passes, median {statistics.median(passes):.2f} ms, "
+          f"99% under {p99:.2f} ms, max {passes[-1]:.2f} ms; "
+          f"{storm.dropped} slow clients dropped")
+    assert storm.dropped >= 30
+    assert statistics.median(loaded) <= statistics.median(quiet) + 20
+    assert max(loaded) < 300
+    assert p99 < 1
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+build.py - Precompile main.py into an upload bundle for the ESP32-CAM
+
+MicroPython normally compiles main.py on the camera at every boot. That takes
+time and a big chunk of heap before the first photo can be taken. This script
+does the compile on your PC instead:
+
+    pip install mpy-cross==1.21.0      # must match the firmware version
+    python3 tools/build.py
+    ampy --port /dev/ttyUSB0 rm main.py   # a main.py on the board wins over main.mpy
+    ampy --port /dev/ttyUSB0 put build/bundle/main.mpy
+    ampy --port /dev/ttyUSB0 put build/bundle/boot.py
+    ampy --port /dev/ttyUSB0 put build/bundle/www /www
+
+Steps:
+  1. Strip the indentation and blank lines inside the multi-line string
+     literals (the dashboard HTML pages), which changes nothing the browser
+     renders. Code and everything else are left as they are.
+  2. Move DASHBOARD_CSS and DASHBOARD_JS out of the code into
+     build/bundle/www/app.css and app.js (the CSS squeezed to one rule per
+     line) and set the constants to None. main.py then serves them from
+     /www on flash, so they never take up heap while main.mpy is loaded.
+  3. Run mpy-cross on the result -> build/bundle/main.mpy
+  4. Copy boot.py next to it -> build/bundle/boot.py
+
+    python3 tools/build.py --bench
+
+imports main.py and the bundle variant on a fake board (tools/fakeboard.py)
+and prints import time, peak and kept heap, and the heap a dashboard page
+render needs. These are CPython numbers, useful for comparing the two
+variants; on the camera boot.py prints the real import time and heap use
+for whichever variant it loaded.
+"""
+
+import argparse
+import ast
+import gc
+import io
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+import tokenize
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILD_DIR = os.path.join(ROOT, "build")
+BUNDLE_DIR = os.path.join(BUILD_DIR, "bundle")
+MODULES = ["main.py"]
+# Copied as source: boot.py must stay a .py file for MicroPython to run it
+COPY_AS_SOURCE = ["boot.py"]
+# Constants in main.py written to build/bundle/www/ (main.py's ASSET_FOLDER)
+ASSETS = [("DASHBOARD_CSS", "app.css"), ("DASHBOARD_JS", "app.js")]
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakeboard  # noqa: E402
+
+
+def multiline_string_rows(source):
+    """(first_row, last_row) of every string literal spanning several lines"""
+    rows = []
+    start = None
+    for tok in tokenize.generate_tokens(io.StringIO(source).readline):
+        name = tokenize.tok_name[tok.type]
+        if name == "STRING" and tok.start[0] != tok.end[0]:
+            rows.append((tok.start[0], tok.end[0]))
+        elif name == "FSTRING_START":  # Python 3.12+ splits f-strings up
+            start = tok.start[0]
+        elif name == "FSTRING_END" and start is not None:
+            if start != tok.end[0]:
+                rows.append((start, tok.end[0]))
+            start = None
+    return rows
+
+
+def minify_css(css):
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,])\s*", r"\1", css)
+    return css.replace(";}", "}\n").strip() + "\n"
+
+
+def strip_source(source):
+    """Remove layout-only whitespace inside multi-line strings"""
+    lines = source.split("\n")
+    inside = set()
+    for first, last in multiline_string_rows(source):
+        # Lines after the opening quote, up to and including the closing one
+        inside.update(range(first + 1, last + 1))
+
+    out = []
+    for row, line in enumerate(lines, start=1):
+        if row in inside:
+            line = line.lstrip(" \t")
+            if not line:
+                continue
+        out.append(line)
+    return "\n".join(out)
+
+
+def extract_assets(source):
+    """Move the ASSETS constants into files: returns (source, {filename: bytes})"""
+    files = {}
+    for name, filename in ASSETS:
+        match = re.search(r'^%s = (b""".*?""")' % name, source, re.S | re.M)
+        if not match:
+            raise SystemExit(f"{name} not found in main.py")
+        data = ast.literal_eval(match.group(1))
+        if filename.endswith(".css"):
+            data = minify_css(data.decode()).encode()
+        files[filename] = data
+        source = source[:match.start(1)] + "None" + source[match.end(1):]
+    return source, files
+
+
+def bundle_source(source):
+    """What goes into main.mpy, plus the asset files for /www"""
+    return extract_assets(strip_source(source))
+
+
+def find_mpy_cross():
+    exe = shutil.which("mpy-cross")
+    if exe:
+        return [exe]
+    try:
+        import mpy_cross  # noqa: F401  (pip install mpy-cross)
+        return [sys.executable, "-m", "mpy_cross"]
+    except ImportError:
+        return None
+
+
+def build(strip_only=False):
+    os.makedirs(BUNDLE_DIR, exist_ok=True)
+    mpy_cross = None if strip_only else find_mpy_cross()
+    if not strip_only and mpy_cross is None:
+        print("mpy-cross not found: pip install mpy-cross==1.21.0 (match your firmware)")
+        return 1
+
+    for module in MODULES:
+        with open(os.path.join(ROOT, module)) as f:
+            source = f.read()
+        stripped, assets = bundle_source(source)
+        # Make sure stripping did not break anything before shipping it
+        compile(stripped, module, "exec")
+        stripped_path = os.path.join(BUILD_DIR, module)
+        with open(stripped_path, "w") as f:
+            f.write(stripped)
+        print(f"{module}: {len(source)} -> {len(stripped)} bytes of source")
+        write_assets(assets)
+
+        if strip_only:
+            continue
+        mpy_path = os.path.join(BUNDLE_DIR, module[:-3] + ".mpy")
+        subprocess.run(mpy_cross + ["-o", mpy_path, "-s", module, stripped_path], check=True)
+        print(f"  -> {os.path.relpath(mpy_path, ROOT)}: {os.path.getsize(mpy_path)} bytes")
+
+    for name in COPY_AS_SOURCE:
+        shutil.copy(os.path.join(ROOT, name), os.path.join(BUNDLE_DIR, name))
+    print(f"Bundle ready in {os.path.relpath(BUNDLE_DIR, ROOT)}/")
+    return 0
+
+
+def write_assets(assets):
+    www = os.path.join(BUNDLE_DIR, "www")
+    os.makedirs(www, exist_ok=True)
+    for filename, data in assets.items():
+        with open(os.path.join(www, filename), "wb") as f:
+            f.write(data)
+        print(f"  -> {os.path.relpath(os.path.join(www, filename), ROOT)}: {len(data)} bytes")
+
+
+def import_variant(text, precompiled, assets):
+    """Import one variant of main.py on a fake board and render the dashboard.
+
+    main.py is compiled on the camera as part of the import, main.mpy was
+    compiled on the PC, so compile cost is only counted for the source variant.
+    The code object does count as kept heap for both: loading main.mpy puts
+    its bytecode and constants on the heap too.
+    Returns a dict of timings (ms) and heap sizes (bytes).
+    """
+    result = {}
+    gc.collect()
+    if not precompiled:
+        tracemalloc.start()
+        start = time.perf_counter()
+        compile(text, "main.py", "exec")
+        result["compile_ms"] = (time.perf_counter() - start) * 1000
+        result["compile_peak"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    board = fakeboard.Board(quiet=True)
+    for filename, data in assets.items():
+        board.sd.add("/www/" + filename, data)
+    gc.collect()
+    tracemalloc.start()
+    code = compile(text, "main.py", "exec")
+    gc.collect()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    main = board.load_main(code=code)
+    result["import_ms"] = (time.perf_counter() - start) * 1000
+    gc.collect()
+    result["kept"], result["peak"] = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    # The page plus the two files a first visit also fetches
+    page = main.web_page()
+    css = main.dashboard_asset("app.css", main.DASHBOARD_CSS)
+    js = main.dashboard_asset("app.js", main.DASHBOARD_JS)
+    result["render_peak"] = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    del page, css, js
+    return result
+
+
+def median(runs, key):
+    return sorted(r[key] for r in runs)[len(runs) // 2]
+
+
+def bench(rounds=10):
+    print("Importing main.py on a fake board (tools/fakeboard.py). These are CPython")
+    print("numbers for comparing the variants; boot.py prints the real ones on the camera.\n")
+    print(f"{'variant':<9}{'bytes':>7}{'compile ms':>11}{'compile KB':>11}"
+          f"{'import ms':>10}{'peak KB':>8}{'kept KB':>8}{'page KB':>8}")
+    with open(os.path.join(ROOT, "main.py")) as f:
+        source = f.read()
+    bundled, assets = bundle_source(source)
+    for variant, text, precompiled, files in (("source", source, False, {}),
+                                              ("bundle", bundled, True, assets)):
+        runs = [import_variant(text, precompiled, files) for _ in range(rounds)]
+        if precompiled:
+            compile_cols = f"{'-':>11}{'-':>11}"
+        else:
+            compile_cols = (f"{median(runs, 'compile_ms'):>11.2f}"
+                            f"{median(runs, 'compile_peak') // 1024:>11}")
+        print(f"{variant:<9}{len(text):>7}{compile_cols}{median(runs, 'import_ms'):>10.2f}"
+              f"{median(runs, 'peak') // 1024:>8}{median(runs, 'kept') // 1024:>8}"
+              f"{median(runs, 'render_peak') // 1024:>8}")
+    print(f"\nMedians of {rounds} runs. compile: only happens on the camera for main.py.")
+    print("import: running the module body. peak/kept KB: heap at most / still used")
+    print("after the import. page KB: heap to render the dashboard and its css/js.")
+    mpy_path = os.path.join(BUNDLE_DIR, "main.mpy")
+    if os.path.exists(mpy_path):
+        print(f"\nbuild/bundle/main.mpy: {os.path.getsize(mpy_path)} bytes, "
+              f"www/: {sum(len(d) for d in assets.values())} bytes")
+    else:
+        print("\nRun tools/build.py first to see the main.mpy size")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the precompiled ESP32-CAM upload bundle")
+    parser.add_argument("--strip-only", action="store_true",
+                        help="only write the stripped source to build/, skip mpy-cross")
+    parser.add_argument("--bench", action="store_true",
+                        help="compare compile cost of the source and stripped variants")
+    args = parser.parse_args(argv)
+    if args.bench:
+        return bench()
+    return build(strip_only=args.strip_only)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,647 @@
+#!/usr/bin/env python3
+"""
+fakeboard.py - CPython stand-ins for the ESP32-CAM side of main.py
+
+main.py imports MicroPython modules (camera, machine, network, utime, uos)
+that don't exist on a PC. This file fakes just enough of them to import
+main.py and drive it: a virtual clock, an in-memory SD card, a camera that
+returns whatever frames you give it and a shutter pin you can flip.
+
+    import fakeboard
+    board = fakeboard.Board()
+    main = board.load_main(BURST_FRAMES=3)   # fresh main.py, config overridden
+    board.camera.frames = [fakeboard.jpeg(20000)]
+    main.take_photo()
+
+Used by tools/build.py --bench and the tests in tests/.
+"""
+
+import calendar
+import collections
+import errno
+import os
+import select
+import socket
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_PY = os.path.join(ROOT, "main.py")
+EPOCH = 1767225600  # 2026-01-01 00:00:00, what the virtual clock starts at
+
+
+def jpeg(size, fill=b"\x55"):
+    """Bytes that look like a whole JPEG (SOI ... EOI) of the given size"""
+    return b"\xff\xd8" + fill * (size - 4) + b"\xff\xd9"
+
+
+class BoardReset(BaseException):
+    """machine.reset() was called. BaseException, so main.py's handlers don't eat it"""
+
+
+class PowerCut(BaseException):
+    """The power went off in the middle of a filesystem operation"""
+
+
+def read_some(sock, into):
+    """Non-blocking read from a client socket into a bytearray; True once the
+    other end has closed (or reset) the connection"""
+    try:
+        data = sock.recv(65536)
+    except BlockingIOError:
+        return False
+    except ConnectionError:
+        return True
+    if not data:
+        return True
+    into += data
+    return False
+
+
+class Clock:
+    """utime/time for main.py. Virtual by default: sleeping just moves it forward"""
+
+    def __init__(self, real=False):
+        self.real = real
+        self.ms = 0
+        self._start = time.monotonic()
+
+    def ticks_ms(self):
+        if self.real:
+            return int((time.monotonic() - self._start) * 1000)
+        return self.ms
+
+    def ticks_diff(self, a, b):
+        return a - b
+
+    def ticks_add(self, a, b):
+        return a + b
+
+    def advance(self, ms):
+        if self.real:
+            time.sleep(ms / 1000)
+        else:
+            self.ms += int(ms)
+
+    def sleep(self, s):
+        self.advance(s * 1000)
+
+    def sleep_ms(self, ms):
+        self.advance(ms)
+
+    def time(self):
+        return EPOCH + self.ticks_ms() // 1000
+
+    def localtime(self, t=None):
+        return tuple(time.gmtime(self.time() if t is None else t))[:8]
+
+    def mktime(self, t):
+        return calendar.timegm(tuple(t[:6]) + (0, 0, 0))
+
+    def module(self):
+        return types.SimpleNamespace(
+            ticks_ms=self.ticks_ms, ticks_diff=self.ticks_diff, ticks_add=self.ticks_add,
+            sleep=self.sleep, sleep_ms=self.sleep_ms, time=self.time,
+            localtime=self.localtime, mktime=self.mktime)
+
+
+class Poll:
+    """select.poll as MicroPython has it: poll() returns the socket objects
+    themselves, CPython's returns file descriptors"""
+
+    def __init__(self):
+        self._poll = select.poll()
+        self._socks = {}
+
+    def register(self, sock, mask=select.POLLIN | select.POLLOUT):
+        self._socks[sock.fileno()] = sock
+        self._poll.register(sock, mask)
+
+    def modify(self, sock, mask):
+        self._poll.modify(sock, mask)
+
+    def unregister(self, sock):
+        fd = sock.fileno()
+        if fd < 0:
+            # Closed already: find it by object
+            fd = next(k for k, v in self._socks.items() if v is sock)
+        self._socks.pop(fd, None)
+        self._poll.unregister(fd)
+
+    def poll(self, timeout=-1):
+        return [(self._socks[fd], event) for fd, event in self._poll.poll(timeout)
+                if fd in self._socks]
+
+
+SELECT = types.SimpleNamespace(
+    poll=Poll, POLLIN=select.POLLIN, POLLOUT=select.POLLOUT,
+    POLLERR=select.POLLERR, POLLHUP=select.POLLHUP)
+
+
+# errno numbers as the ESP32 port has them (newlib). Several differ from
+# Linux: EINPROGRESS is 119 there and 115 is ENETDOWN.
+BOARD_ERRNO = {
+    "ENOENT": 2, "EIO": 5, "EAGAIN": 11, "EEXIST": 17, "ENODEV": 19, "EINVAL": 22,
+    "ENOSPC": 28, "EPIPE": 32, "ECONNRESET": 104, "ESHUTDOWN": 110, "ECONNREFUSED": 111,
+    "ECONNABORTED": 113, "ENETUNREACH": 114, "ENETDOWN": 115, "ETIMEDOUT": 116,
+    "EHOSTUNREACH": 118, "EINPROGRESS": 119, "EALREADY": 120, "EISCONN": 127, "ENOTCONN": 128,
+}
+ERRNO = types.SimpleNamespace(**BOARD_ERRNO)
+_TO_BOARD_ERRNO = {getattr(errno, name): n for name, n in BOARD_ERRNO.items() if hasattr(errno, name)}
+
+
+def board_error(e):
+    """The OSError main.py would see on the camera for a CPython socket error"""
+    return OSError(_TO_BOARD_ERRNO.get(e.errno, e.errno), e.strerror)
+
+
+class MpSocket(socket.socket):
+    """A real socket with MicroPython's stream methods: on a non-blocking
+    socket read()/write() return None instead of raising when nothing moves.
+    Errors carry the ESP32's errno numbers, not Linux's."""
+
+    def accept(self):
+        try:
+            fd, addr = self._accept()
+        except OSError as e:
+            raise board_error(e) from None
+        return MpSocket(self.family, self.type, self.proto, fileno=fd), addr
+
+    def connect(self, addr):
+        try:
+            super().connect(addr)
+        except OSError as e:
+            raise board_error(e) from None
+
+    def send(self, data):
+        try:
+            return super().send(data)
+        except OSError as e:
+            raise board_error(e) from None
+
+    def recv(self, n):
+        try:
+            return super().recv(n)
+        except OSError as e:
+            raise board_error(e) from None
+
+    def read(self, n=-1):
+        try:
+            return super().recv(n if n > 0 else 65536)
+        except BlockingIOError:
+            return None
+        except OSError as e:
+            raise board_error(e) from None
+
+    def write(self, data):
+        try:
+            return super().send(data)
+        except BlockingIOError:
+            return None
+        except OSError as e:
+            raise board_error(e) from None
+
+
+SOCKET = types.SimpleNamespace(
+    socket=MpSocket, getaddrinfo=socket.getaddrinfo,
+    SOL_SOCKET=socket.SOL_SOCKET, SO_REUSEADDR=socket.SO_REUSEADDR)
+
+
+class FakeFile:
+    def __init__(self, sd, path, mode):
+        self.sd = sd
+        self.path = path
+        self.text = "b" not in mode
+        self.pos = 0
+        if "r" in mode:
+            sd.count("open", mutating=False)
+            if path not in sd.files:
+                raise OSError(2, "ENOENT")
+        elif "a" in mode:
+            if sd.count("append"):
+                raise PowerCut()
+            sd.files.setdefault(path, bytearray())
+            self.pos = len(sd.files[path])
+        else:
+            if sd.count("create"):
+                raise PowerCut()
+            sd.files[path] = bytearray()
+
+    def write(self, data):
+        if self.text:
+            data = data.encode()
+        cut = self.sd.count("write")
+        if cut:
+            # Power went while writing: only part of it reached the card
+            data = data[:len(data) // 2]
+        self.sd.grow(self.path, self.pos + len(data))
+        self.sd.files[self.path][self.pos:self.pos + len(data)] = data
+        self.pos += len(data)
+        if cut:
+            raise PowerCut()
+        return len(data)
+
+    def read(self, n=-1):
+        data = self.sd.files[self.path]
+        end = len(data) if n is None or n < 0 else self.pos + n
+        out = bytes(data[self.pos:end])
+        self.pos += len(out)
+        return out.decode() if self.text else out
+
+    def readinto(self, buf):
+        out = self.read(len(buf))
+        buf[:len(out)] = out
+        return len(out)
+
+    def readline(self):
+        data = self.sd.files[self.path]
+        end = data.find(b"\n", self.pos)
+        return self.read(-1 if end < 0 else end + 1 - self.pos)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def seek(self, offset, whence=0):
+        base = (0, self.pos, len(self.sd.files[self.path]))[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeSD:
+    """Flat in-memory filesystem with FAT-like cluster accounting.
+
+    Covers the whole board: /sd/... is the card, anything else is flash.
+    """
+
+    def __init__(self, size_mb=32, cluster=32768):
+        self.cluster = cluster
+        self.clusters = size_mb * 1024 * 1024 // cluster
+        self.files = {}
+        self.dirs = {"/", "/sd"}
+        self.syncs = 0
+        self.ops = collections.Counter()  # operations by kind, for cost comparisons
+        self.cut_in = None
+        self.dead = False
+        self.broken = False  # changes fail with EIO until the card is mounted again
+
+    def cut_power_at(self, n):
+        """Cut the power during the n-th changing operation from now on.
+        After that every operation fails until power_on()."""
+        self.cut_in = n
+
+    def power_on(self):
+        self.cut_in = None
+        self.dead = False
+
+    def count(self, kind, mutating=True):
+        """Count an operation; True if the power goes during this one"""
+        if self.dead:
+            raise PowerCut()
+        if self.broken and mutating:
+            raise OSError(5, "EIO")
+        self.ops[kind] += 1
+        if not mutating or self.cut_in is None:
+            return False
+        self.cut_in -= 1
+        if self.cut_in:
+            return False
+        self.cut_in = None
+        self.dead = True
+        return True
+
+    def mutations(self):
+        return sum(n for kind, n in self.ops.items() if kind not in ("open", "stat", "listdir"))
+
+    def on_card(self, size):
+        return -(-size // self.cluster) * self.cluster
+
+    def used_clusters(self):
+        return sum(self.on_card(len(d)) for d in self.files.values()) // self.cluster
+
+    def grow(self, path, size):
+        extra = self.on_card(size) - self.on_card(len(self.files.get(path, b"")))
+        if extra > 0 and self.used_clusters() + extra // self.cluster > self.clusters:
+            raise OSError(28, "ENOSPC")
+
+    def add(self, path, data):
+        """Put a file on the card directly (test setup)"""
+        self.dirs.add(path.rsplit("/", 1)[0])
+        self.files[path] = bytearray(data)
+
+    def open(self, path, mode="r", *args, **kwargs):
+        return FakeFile(self, path, mode)
+
+    # --- uos ---
+    def listdir(self, path="/"):
+        self.count("listdir", mutating=False)
+        if path not in self.dirs:
+            raise OSError(2, "ENOENT")
+        prefix = path.rstrip("/") + "/"
+        names = set()
+        for p in list(self.files) + list(self.dirs):
+            if p.startswith(prefix) and p != prefix:
+                names.add(p[len(prefix):].split("/", 1)[0])
+        return sorted(names)
+
+    def mkdir(self, path):
+        if path in self.dirs or path in self.files:
+            raise OSError(17, "EEXIST")
+        if self.count("mkdir"):
+            raise PowerCut()
+        self.dirs.add(path)
+
+    def rmdir(self, path):
+        if self.listdir(path):
+            raise OSError(39, "ENOTEMPTY")
+        self.dirs.discard(path)
+
+    def remove(self, path):
+        if path not in self.files:
+            raise OSError(2, "ENOENT")
+        if self.count("remove"):
+            raise PowerCut()
+        del self.files[path]
+
+    def rename(self, old, new):
+        if old not in self.files:
+            raise OSError(2, "ENOENT")
+        if self.count("rename"):
+            raise PowerCut()
+        self.files[new] = self.files.pop(old)
+
+    def stat(self, path):
+        self.count("stat", mutating=False)
+        if path in self.dirs:
+            return (0x4000, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+        if path not in self.files:
+            raise OSError(2, "ENOENT")
+        return (0x8000, 0, 0, 0, 0, 0, len(self.files[path]), 0, 0, 0)
+
+    def statvfs(self, path):
+        free = self.clusters - self.used_clusters()
+        return (self.cluster, self.cluster, self.clusters, free, free, 0, 0, 0, 0, 255)
+
+    def sync(self):
+        if self.count("sync"):
+            raise PowerCut()
+        self.syncs += 1
+
+    def mount(self, dev, path):
+        self.broken = False
+        self.dirs.add(path)
+
+    def umount(self, path):
+        pass
+
+    def module(self):
+        return types.SimpleNamespace(
+            listdir=self.listdir, mkdir=self.mkdir, rmdir=self.rmdir, remove=self.remove,
+            rename=self.rename, stat=self.stat, statvfs=self.statvfs, sync=self.sync,
+            mount=self.mount, umount=self.umount)
+
+
+class FakeCamera:
+    """Returns frames from .frames in turn (the last one repeats); each capture
+    takes capture_ms on the board clock"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.frames = [jpeg(30000)]
+        self.captures = 0
+        self.capture_ms = 120
+        self.fail = False  # captures fail until the camera is initialised again
+
+    def init(self, *args, **kwargs):
+        self.fail = False
+
+    def capture(self):
+        self.clock.advance(self.capture_ms)
+        if self.fail:
+            return False
+        frame = self.frames[min(self.captures, len(self.frames) - 1)]
+        self.captures += 1
+        return frame
+
+    def module(self):
+        noop = lambda *a, **k: None
+        return types.SimpleNamespace(
+            init=self.init, deinit=noop, framesize=noop, quality=noop, gainceiling=noop,
+            capture=self.capture, JPEG=0, PSRAM=1)
+
+
+class Board:
+    def __init__(self, real_time=False, sd_mb=32, quiet=False, sd=None):
+        self.clock = Clock(real_time)
+        self.sd = sd or FakeSD(sd_mb)
+        self.camera = FakeCamera(self.clock)
+        self.quiet = quiet
+        self.shutter = 1           # pulled up; 0 while the switch is pressed
+        self.sd_mount_ok = True
+        self.wifi_up = True
+        self.reset_cause = 1
+        self.wdt_timeout = None
+        self.main = None
+        self.pass_ms = []          # wall-clock time of every main loop pass run() made
+
+    def machine_module(self):
+        board = self
+
+        class Pin:
+            IN, OUT, PULL_UP = 1, 2, 3
+
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def value(self):
+                return board.shutter
+
+        class WDT:
+            def __init__(self, timeout=5000):
+                board.wdt_timeout = timeout
+
+            def feed(self):
+                pass
+
+        def SDCard():
+            if not board.sd_mount_ok:
+                raise OSError(19, "ENODEV")
+            return object()
+
+        def reset():
+            raise BoardReset()
+
+        return types.SimpleNamespace(
+            Pin=Pin, WDT=WDT, SDCard=SDCard, reset=reset,
+            reset_cause=lambda: board.reset_cause,
+            PWRON_RESET=1, HARD_RESET=2, WDT_RESET=3, DEEPSLEEP_RESET=4, SOFT_RESET=5)
+
+    def network_module(self):
+        board = self
+
+        class WLAN:
+            def __init__(self, iface=0):
+                pass
+
+            def active(self, *args):
+                return True
+
+            def config(self, **kwargs):
+                pass
+
+            def connect(self, *args):
+                pass
+
+            def isconnected(self):
+                return board.wifi_up
+
+            def ifconfig(self):
+                return ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
+
+        return types.SimpleNamespace(WLAN=WLAN, STA_IF=0, AP_IF=1)
+
+    def modules(self):
+        return {
+            "camera": self.camera.module(),
+            "errno": ERRNO,
+            "machine": self.machine_module(),
+            "network": self.network_module(),
+            "utime": self.clock.module(),
+            "uos": self.sd.module(),
+        }
+
+    def load_main(self, source=None, code=None, path=MAIN_PY, **config):
+        """Run a fresh copy of main.py against this board and return it as a module.
+
+        Keyword arguments override main.py settings, like editing the top of the file.
+        The web server gets a free port unless WEB_PORT is given.
+        """
+        import sys
+        config.setdefault("WEB_PORT", 0)
+        if code is None:
+            if source is None:
+                with open(path) as f:
+                    source = f.read()
+            code = compile(source, path, "exec")
+        fakes = self.modules()
+        saved = {name: sys.modules.get(name) for name in fakes}
+        sys.modules.update(fakes)
+        try:
+            module = types.ModuleType("main")
+            module.__file__ = path
+            exec(code, module.__dict__)
+        finally:
+            for name, mod in saved.items():
+                if mod is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = mod
+        # main.py also uses time/os/open, which CPython has but the board's differ
+        module.time = fakes["utime"]
+        module.os = fakes["uos"]
+        module.open = self.sd.open
+        module.select = SELECT
+        module.socket = SOCKET
+        if self.quiet:
+            module.print = lambda *args, **kwargs: None
+        for name, value in config.items():
+            if not hasattr(module, name):
+                raise AttributeError(f"main.py has no setting {name}")
+            setattr(module, name, value)
+        self.main = module
+        return module
+
+    def boot(self):
+        """Run main.py's setup(), the part of main() before the loop"""
+        assert self.main.setup()
+
+    @property
+    def web_port(self):
+        return self.main.s.getsockname()[1]
+
+    def shutdown(self):
+        """Close every socket main.py opened"""
+        main = self.main
+        main.web_close_all()
+        for client in main.sse_clients[:]:
+            main.sse_drop(client)
+        main.upload_close()
+        main.mqtt_close()
+        if getattr(main, "s", None) is not None:
+            main.s.close()
+
+    def boot_filesystem(self):
+        """Mount the card and set up folders the way main() does"""
+        main = self.main
+        main.mount_sd_card()
+        main.setup_filesystem()
+        main.refresh_free_space()
+
+    def run(self, ms, step_ms=10, until=None):
+        """Run main loop passes for ms of board time (sleeping step_ms between
+        them like main() does), or until until() is true.
+        Returns the longest single pass in wall-clock ms."""
+        main = self.main
+        end = self.clock.ticks_ms() + ms
+        longest = 0
+        while self.clock.ticks_ms() < end:
+            start = time.perf_counter()
+            main.loop_once()
+            took = (time.perf_counter() - start) * 1000
+            self.pass_ms.append(took)
+            longest = max(longest, took)
+            if until is not None and until():
+                break
+            self.clock.advance(step_ms)
+        return longest
+
+    def press(self, hold_ms=30, wait_ms=3000, also=None):
+        """Press and release the shutter with the main loop running, then keep
+        it running until the photo is saved. Returns ms from press to saved.
+        also() is called after every pass, e.g. to keep test clients busy."""
+        main = self.main
+        before = main.picture_count
+        start = self.clock.ticks_ms()
+        self.shutter = 0
+        self.run(hold_ms, until=also)
+        self.shutter = 1
+        self.run(wait_ms, until=lambda: (also and also()) or main.picture_count > before)
+        assert main.picture_count > before, "shutter press was missed"
+        return self.clock.ticks_ms() - start
+
+    # --- web clients, on real sockets to main.py's server ---
+    def web_client(self, request=None):
+        """A non-blocking client of the web server. The connect doesn't wait for
+        the server, unless there is a request to send."""
+        sock = socket.socket()
+        sock.setblocking(False)
+        sock.connect_ex(("127.0.0.1", self.web_port))
+        if request:
+            select.select([], [sock], [], 2)
+            sock.setblocking(True)
+            sock.sendall(request.encode())
+            sock.setblocking(False)
+        return sock
+
+    def web_get(self, path="/", wait_ms=3000):
+        """GET path with the main loop running; returns the whole raw reply"""
+        sock = self.web_client(f"GET {path} HTTP/1.1\r\nHost: camera\r\n\r\n")
+        reply = bytearray()
+        self.run(wait_ms, until=lambda: read_some(sock, reply))
+        sock.close()
+        return bytes(reply)
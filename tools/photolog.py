@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+photolog.py - Host-side analysis of the ESP32-CAM photos.log
+
+Copy logs/photos.log off the SD card (or point this at the mounted card) and
+run it on your desktop, NOT on the ESP32:
+
+    python3 tools/photolog.py /media/$USER/SDCARD/logs/photos.log
+    python3 tools/photolog.py --json old_prints.log photos.log > report.json
+    python3 tools/photolog.py --photos /media/$USER/SDCARD/photos photos.log
+    python3 tools/photolog.py --bench 1000000
+
+Every line main.py writes looks like:
+
+    2025-12-03 10:30:45 | Photo #0001 | photo_0001_2025-12-03_10-30-44.jpg | 123456 bytes
+
+The log is read line by line and only per-session counters are kept, so a
+multi-GB log costs the same memory as a small one. photos.log is the only
+record the firmware writes (there is no binary index on the card).
+
+What it reports, per session (a print job):
+  - frames, duration, inter-frame interval min/mean/p50/p90/max + histogram
+  - sequence gaps (photo numbers that were skipped, e.g. the log write failed)
+  - interval outliers (a layer where the switch did not fire, or a capture
+    that failed and was retried on the next layer)
+  - capture path time (log timestamp minus the time in the filename, which
+    take_photo() stamps before writing the JPEG)
+
+A new session starts when the photo number goes backwards (Format SD) or when
+no frame was logged for --session-gap seconds.
+
+With --photos, the photo folder is cross-checked: .jpg files that have no log
+line are frames that were saved but never logged (log write failed, or the
+firmware was older and refused to log a frame whose size did not match).
+"""
+
+import argparse
+import calendar
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+# No frame for this long means the print ended (or a new one started)
+SESSION_GAP_S = 30 * 60
+
+# Display buckets for the interval histogram (upper bounds, seconds)
+HISTOGRAM_BUCKETS = (1, 2, 3, 5, 10, 15, 20, 30, 45, 60, 90, 120, 300, 600)
+
+# Outlier detection: interval > OUTLIER_FACTOR x the running average
+OUTLIER_FACTOR = 2.5
+OUTLIER_MIN_EXCESS_S = 3
+OUTLIER_WARMUP = 5
+
+# Keep at most this many example lines per finding per session
+MAX_EXAMPLES = 10
+
+
+class Session:
+    """Running counters for one print session (constant size)"""
+
+    __slots__ = (
+        "index", "source", "first_line", "start", "end", "first_seq",
+        "last_seq", "frames", "bytes", "min_size", "max_size",
+        "interval_counts", "interval_sum", "ewma", "gaps", "missing",
+        "gap_examples", "outliers", "outlier_examples", "duplicates",
+        "name_mismatches", "capture_counts", "bad_lines",
+    )
+
+    def __init__(self, index, source, line_no, ts, seq):
+        self.index = index
+        self.source = source
+        self.first_line = line_no
+        self.start = ts
+        self.end = ts
+        self.first_seq = seq
+        self.last_seq = seq
+        self.frames = 0
+        self.bytes = 0
+        self.min_size = None
+        self.max_size = 0
+        # Timestamps have 1 s resolution, so exact per-second counts are
+        # bounded by the session gap and give exact percentiles.
+        self.interval_counts = {}
+        self.interval_sum = 0
+        self.ewma = None
+        self.gaps = 0
+        self.missing = 0
+        self.gap_examples = []
+        self.outliers = 0
+        self.outlier_examples = []
+        self.duplicates = 0
+        self.name_mismatches = 0
+        self.capture_counts = {}
+        self.bad_lines = 0
+
+    def summary(self):
+        intervals = self.frames - 1
+        counts = self.interval_counts
+        return {
+            "session": self.index,
+            "source": self.source,
+            "first_line": self.first_line,
+            "start": format_ts(self.start),
+            "end": format_ts(self.end),
+            "duration_s": self.end - self.start,
+            "first_photo": self.first_seq,
+            "last_photo": self.last_seq,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "frame_size": {
+                "min": self.min_size or 0,
+                "mean": self.bytes // self.frames if self.frames else 0,
+                "max": self.max_size,
+            },
+            "interval_s": {
+                "count": intervals,
+                "min": min(counts) if counts else None,
+                "mean": round(self.interval_sum / intervals, 2) if intervals > 0 else None,
+                "p50": percentile(counts, intervals, 0.50),
+                "p90": percentile(counts, intervals, 0.90),
+                "p99": percentile(counts, intervals, 0.99),
+                "max": max(counts) if counts else None,
+            },
+            "histogram": bucket_histogram(counts),
+            "sequence_gaps": self.gaps,
+            "missing_frames": self.missing,
+            "gap_examples": self.gap_examples,
+            "outliers": self.outliers,
+            "outlier_examples": self.outlier_examples,
+            "duplicate_numbers": self.duplicates,
+            "filename_mismatches": self.name_mismatches,
+            "capture_s": {
+                "p50": percentile(self.capture_counts, self.frames, 0.50),
+                "p90": percentile(self.capture_counts, self.frames, 0.90),
+                "max": max(self.capture_counts) if self.capture_counts else None,
+            },
+            "bad_lines": self.bad_lines,
+        }
+
+
+def format_ts(epoch):
+    t = time.gmtime(epoch)
+    return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(*t[:6])
+
+
+def percentile(counts, total, q):
+    """Percentile from an {integer value: count} map"""
+    if total <= 0 or not counts:
+        return None
+    rank = q * total
+    seen = 0
+    for value in sorted(counts):
+        seen += counts[value]
+        if seen >= rank:
+            return value
+    return max(counts)
+
+
+def bucket_histogram(counts):
+    """Fold per-second counts into the HISTOGRAM_BUCKETS display buckets"""
+    buckets = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+    for value, n in counts.items():
+        for i, upper in enumerate(HISTOGRAM_BUCKETS):
+            if value < upper:
+                buckets[i] += n
+                break
+        else:
+            buckets[-1] += n
+    labels = []
+    lower = 0
+    for upper in HISTOGRAM_BUCKETS:
+        labels.append(f"{lower}-{upper}s")
+        lower = upper
+    labels.append(f">={lower}s")
+    return dict(zip(labels, buckets))
+
+
+class Analyzer:
+    """Streams photos.log lines into per-session summaries"""
+
+    def __init__(self, session_gap=SESSION_GAP_S, photo_names=None):
+        self.session_gap = session_gap
+        self.sessions = []
+        self.current = None
+        self.lines = 0
+        self.bad_lines = 0
+        self.bytes_read = 0
+        # Optional cross-check against the photo folder
+        self.unlogged = photo_names
+        # One-entry cache: consecutive lines almost always share a date
+        self._day = None
+        self._day_epoch = 0
+        self._name_day = None
+        self._name_day_epoch = 0
+
+    def _day_start(self, date_str):
+        if date_str != self._day:
+            self._day = date_str
+            self._day_epoch = calendar.timegm(
+                (int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]), 0, 0, 0))
+        return self._day_epoch
+
+    def _name_epoch(self, name):
+        # photo_NNNN_YYYY-MM-DD_HH-MM-SS.jpg
+        date_str = name[11:21]
+        if date_str != self._name_day:
+            self._name_day = date_str
+            self._name_day_epoch = calendar.timegm(
+                (int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]), 0, 0, 0))
+        return (self._name_day_epoch + int(name[22:24]) * 3600
+                + int(name[25:27]) * 60 + int(name[28:30]))
+
+    def _close_session(self):
+        if self.current is not None and self.current.frames:
+            self.sessions.append(self.current.summary())
+        self.current = None
+
+    def feed_file(self, source, stream):
+        line_no = 0
+        for line in stream:
+            line_no += 1
+            self.lines += 1
+            self.bytes_read += len(line)
+            try:
+                ts_str, photo, name, size = line.rstrip("\r\n").split(" | ")
+                ts = (self._day_start(ts_str[:10]) + int(ts_str[11:13]) * 3600
+                      + int(ts_str[14:16]) * 60 + int(ts_str[17:19]))
+                seq = int(photo[7:])
+                size = int(size[:-6])
+            except ValueError:
+                self.bad_lines += 1
+                if self.current is not None:
+                    self.current.bad_lines += 1
+                continue
+            self._feed(source, line_no, ts, seq, name, size)
+
+    def _feed(self, source, line_no, ts, seq, name, size):
+        s = self.current
+        if s is not None:
+            interval = ts - s.end
+            if seq < s.last_seq or interval > self.session_gap or interval < 0:
+                self._close_session()
+                s = None
+
+        if s is None:
+            s = self.current = Session(len(self.sessions), source, line_no, ts, seq)
+        elif seq == s.last_seq:
+            s.duplicates += 1
+        else:
+            if seq > s.last_seq + 1:
+                s.gaps += 1
+                s.missing += seq - s.last_seq - 1
+                if len(s.gap_examples) < MAX_EXAMPLES:
+                    s.gap_examples.append({
+                        "line": f"{source}:{line_no}",
+                        "after": s.last_seq, "next": seq,
+                        "missing": seq - s.last_seq - 1,
+                    })
+            interval = ts - s.end
+            counts = s.interval_counts
+            counts[interval] = counts.get(interval, 0) + 1
+            s.interval_sum += interval
+            ewma = s.ewma
+            if ewma is not None and s.frames >= OUTLIER_WARMUP:
+                if interval > ewma * OUTLIER_FACTOR and interval - ewma > OUTLIER_MIN_EXCESS_S:
+                    s.outliers += 1
+                    if len(s.outlier_examples) < MAX_EXAMPLES:
+                        s.outlier_examples.append({
+                            "line": f"{source}:{line_no}",
+                            "photo": seq, "interval_s": interval,
+                            "expected_s": round(ewma, 1),
+                        })
+                    # Don't let one stall drag the baseline up
+                    interval = min(interval, ewma * OUTLIER_FACTOR)
+            s.ewma = interval if ewma is None else ewma * 0.8 + interval * 0.2
+
+        s.frames += 1
+        s.end = ts
+        s.last_seq = seq
+        s.bytes += size
+        if s.min_size is None or size < s.min_size:
+            s.min_size = size
+        if size > s.max_size:
+            s.max_size = size
+
+        try:
+            if int(name[6:10]) != seq:
+                s.name_mismatches += 1
+            capture = ts - self._name_epoch(name)
+            s.capture_counts[capture] = s.capture_counts.get(capture, 0) + 1
+        except ValueError:
+            s.name_mismatches += 1
+
+        if self.unlogged is not None:
+            self.unlogged.discard(name)
+
+    def finish(self):
+        self._close_session()
+        totals = {
+            "lines": self.lines,
+            "bad_lines": self.bad_lines,
+            "sessions": len(self.sessions),
+            "frames": sum(s["frames"] for s in self.sessions),
+            "missing_frames": sum(s["missing_frames"] for s in self.sessions),
+            "outliers": sum(s["outliers"] for s in self.sessions),
+        }
+        report = {"totals": totals, "sessions": self.sessions}
+        if self.unlogged is not None:
+            unlogged = sorted(self.unlogged)
+            report["unlogged_files"] = {
+                "count": len(unlogged),
+                "examples": unlogged[:MAX_EXAMPLES],
+            }
+        return report
+
+
+def open_log(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace", buffering=1 << 20)
+
+
+def print_text(report, out=sys.stdout):
+    totals = report["totals"]
+    print("=" * 60, file=out)
+    print(f"photos.log: {totals['lines']} lines, {totals['sessions']} sessions, "
+          f"{totals['frames']} frames", file=out)
+    print(f"  Missing frames: {totals['missing_frames']}  "
+          f"Outliers: {totals['outliers']}  Bad lines: {totals['bad_lines']}", file=out)
+    print("=" * 60, file=out)
+
+    for s in report["sessions"]:
+        iv = s["interval_s"]
+        cap = s["capture_s"]
+        print(f"\nSession {s['session']}  ({s['source']}:{s['first_line']})", file=out)
+        print(f"  {s['start']} -> {s['end']}  ({s['duration_s']} s)", file=out)
+        print(f"  Photos #{s['first_photo']:04d}-#{s['last_photo']:04d}: "
+              f"{s['frames']} frames, {s['bytes'] // 1024} KB "
+              f"(avg {s['frame_size']['mean'] // 1024} KB)", file=out)
+        if iv["count"]:
+            print(f"  Interval: min {iv['min']} / mean {iv['mean']} / p50 {iv['p50']} / "
+                  f"p90 {iv['p90']} / max {iv['max']} s", file=out)
+        print(f"  Capture path: p50 {cap['p50']} / p90 {cap['p90']} / max {cap['max']} s",
+              file=out)
+        print(f"  Sequence gaps: {s['sequence_gaps']} ({s['missing_frames']} frames missing)"
+              f"  Duplicates: {s['duplicate_numbers']}"
+              f"  Name mismatches: {s['filename_mismatches']}", file=out)
+        for g in s["gap_examples"]:
+            print(f"    gap  {g['line']}: #{g['after']:04d} -> #{g['next']:04d} "
+                  f"({g['missing']} missing)", file=out)
+        print(f"  Outliers: {s['outliers']}", file=out)
+        for o in s["outlier_examples"]:
+            print(f"    slow {o['line']}: #{o['photo']:04d} after {o['interval_s']} s "
+                  f"(expected ~{o['expected_s']} s)", file=out)
+        if iv["count"]:
+            peak = max(s["histogram"].values()) or 1
+            for label, n in s["histogram"].items():
+                if n:
+                    bar = "#" * max(1, n * 40 // peak)
+                    print(f"    {label:>9} {n:8d} {bar}", file=out)
+
+    unlogged = report.get("unlogged_files")
+    if unlogged is not None:
+        print(f"\nFiles on card with no log line: {unlogged['count']}", file=out)
+        for name in unlogged["examples"]:
+            print(f"    {name}", file=out)
+
+
+def write_synthetic_log(path, lines, seed=1):
+    """Write a synthetic photos.log with known gaps, stalls and sessions"""
+    import random
+    rng = random.Random(seed)
+    injected = {"sessions": 1, "missing": 0, "outliers": 0}
+    ts = calendar.timegm((2025, 12, 1, 8, 0, 0))
+    seq = 0
+    with open(path, "w", buffering=1 << 20) as f:
+        for i in range(lines):
+            if i and i % 250000 == 0:
+                # Next print after a Format SD
+                ts += SESSION_GAP_S + 600
+                seq = 0
+                injected["sessions"] += 1
+            elif i:
+                r = rng.random()
+                if r < 0.001:
+                    ts += 60  # switch did not fire for a few layers
+                    injected["outliers"] += 1
+                else:
+                    ts += rng.randint(8, 12)
+                if rng.random() < 0.0005:
+                    seq += 1  # log line lost
+                    injected["missing"] += 1
+            t = time.gmtime(ts)
+            c = time.gmtime(ts - rng.randint(0, 2))
+            stamp = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(*t[:6])
+            name = "photo_{:04d}_{:04d}-{:02d}-{:02d}_{:02d}-{:02d}-{:02d}.jpg".format(seq, *c[:6])
+            f.write(f"{stamp} | Photo #{seq:04d} | {name} | {rng.randint(90000, 160000)} bytes\n")
+            seq += 1
+    return injected
+
+
+def run_benchmark(lines):
+    import resource
+    fd, path = tempfile.mkstemp(suffix=".log", prefix="photolog_bench_")
+    os.close(fd)
+    try:
+        print(f"Generating synthetic log: {lines} lines...")
+        injected = write_synthetic_log(path, lines)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        start = time.perf_counter()
+        analyzer = Analyzer()
+        with open_log(path) as f:
+            analyzer.feed_file(path, f)
+        report = analyzer.finish()
+        elapsed = time.perf_counter() - start
+
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        totals = report["totals"]
+        print(f"  Log size:    {size_mb:.1f} MB")
+        print(f"  Parse time:  {elapsed:.2f} s  ({lines / elapsed:,.0f} lines/s, "
+              f"{size_mb / elapsed:.1f} MB/s)")
+        print(f"  Peak RSS growth: {(rss_after - rss_before) / 1024:.1f} MB")
+        print(f"  Sessions: {totals['sessions']} (injected {injected['sessions']})")
+        print(f"  Missing:  {totals['missing_frames']} (injected {injected['missing']})")
+        print(f"  Outliers: {totals['outliers']} (injected {injected['outliers']})")
+    finally:
+        os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analyse ESP32-CAM photos.log files (layer cadence, gaps, stalls)")
+    parser.add_argument("logs", nargs="*", help="photos.log files (.gz ok, - for stdin)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--photos", metavar="DIR",
+                        help="photo folder to cross-check for frames with no log line")
+    parser.add_argument("--session-gap", type=int, default=SESSION_GAP_S, metavar="SECONDS",
+                        help=f"idle time that starts a new session (default {SESSION_GAP_S})")
+    parser.add_argument("--bench", type=int, metavar="LINES",
+                        help="benchmark the parser on a synthetic log of LINES lines")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        run_benchmark(args.bench)
+        return 0
+    if not args.logs:
+        parser.error("no log files given")
+
+    photo_names = None
+    if args.photos:
+        photo_names = {f for f in os.listdir(args.photos) if f.endswith(".jpg")}
+
+    analyzer = Analyzer(session_gap=args.session_gap, photo_names=photo_names)
+    for path in args.logs:
+        with open_log(path) as f:
+            analyzer.feed_file(path, f)
+    report = analyzer.finish()
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_text(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+receiver.py - Minimal PC-side receiver for the ESP32-CAM uploader
+
+Run this on a PC on the same network as the camera, then set UPLOAD_URL in
+main.py to point at it:
+
+    python3 tools/receiver.py --port 8080 --out ~/bambu-timelapse
+    UPLOAD_URL = "http://<pc-ip>:8080/upload"
+
+Every photo arrives as a chunked HTTP POST with an X-Filename header and is
+saved under --out with that name. Connections are kept alive, so the camera
+reuses one connection for a whole print.
+"""
+
+import argparse
+import os
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Stats:
+    frames = 0
+    bytes = 0
+    started = None
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    out_dir = "."
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body_chunks(self):
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    # Skip trailers up to the blank line
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    return
+                yield self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get("Content-Length", 0))
+            while remaining > 0:
+                chunk = self.rfile.read(min(65536, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+    def do_POST(self):
+        name = os.path.basename(self.headers.get("X-Filename", ""))
+        if not name.endswith(".jpg"):
+            self._reply(400, b"missing or bad X-Filename\n")
+            return
+
+        final_path = os.path.join(self.out_dir, name)
+        tmp_path = final_path + ".part"
+        size = 0
+        with open(tmp_path, "wb") as f:
+            for chunk in self._body_chunks():
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp_path, final_path)
+
+        if Stats.started is None:
+            Stats.started = time.time()
+        Stats.frames += 1
+        Stats.bytes += size
+        elapsed = time.time() - Stats.started
+        rate = f", {(Stats.frames - 1) / elapsed:.2f} frames/s" if elapsed > 0 else ""
+        print(f"{time.strftime('%H:%M:%S')} {self.client_address[0]} {name} "
+              f"{size} bytes  [{Stats.frames} frames{rate}]")
+        self._reply(200, b"OK\n")
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receive photos pushed by the ESP32-CAM")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--out", default="received", help="folder to save photos in")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    UploadHandler.out_dir = args.out
+    server = ThreadingHTTPServer((args.host, args.port), UploadHandler)
+    print(f"Receiving photos on http://{args.host}:{args.port}/upload -> {args.out}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nReceived {Stats.frames} photos, {Stats.bytes // 1024} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())